@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+#
+# Tests for the Protoc builder.
+#
+
+import importlib.util
+import os
+import tempfile
+import unittest
+
+import SCons.Environment
+import SCons.Errors
+import SCons.Node.Python
+import SCons.SConsign
+
+_spec = importlib.util.spec_from_file_location(
+    "protoc", os.path.join(os.path.dirname(os.path.abspath(__file__)), "__init__.py")
+)
+protoc = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(protoc)
+
+
+def _imports(contents):
+    return protoc._getImports(SCons.Node.Python.Value(contents))
+
+
+class TestImports(unittest.TestCase):
+    def test_imports(self):
+        text = """
+syntax = "proto3";
+import "a.proto";
+import 'sub/b.proto';
+"""
+        self.assertEqual(("a.proto", "sub/b.proto"), _imports(text))
+
+    def test_public_and_weak(self):
+        text = """
+import public "a.proto";
+import weak "b.proto";
+import
+    public
+    "c.proto" ;
+"""
+        self.assertEqual(("a.proto", "b.proto", "c.proto"), _imports(text))
+
+    def test_line_comments(self):
+        text = """
+// import "x.proto";
+import "a.proto"; // import "y.proto";
+"""
+        self.assertEqual(("a.proto",), _imports(text))
+
+    def test_block_comments(self):
+        text = """
+/* import "x.proto";
+import "y.proto"; */
+import /* comment */ "a.proto";
+/**/ import "b.proto";
+"""
+        self.assertEqual(("a.proto", "b.proto"), _imports(text))
+
+    def test_strings(self):
+        text = r"""
+option go_package = "example.com/x//import \"x.proto\";";
+option (foo) = 'import "y.proto";';
+option (bar) = "/* import \"z.proto\";";
+import "a.proto";
+"""
+        self.assertEqual(("a.proto",), _imports(text))
+
+    def test_no_imports(self):
+        text = """
+message Import { string imports = 1; }
+"""
+        self.assertEqual((), _imports(text))
+
+    def test_memoized(self):
+        text = 'import "a.proto";\n'
+        self.assertIs(_imports(text), _imports(text))
+
+
+class TestPartitions(unittest.TestCase):
+    sources = ["a/x.proto", "a/y", "b/z.proto", "c.proto"]
+
+    def _partitions(self, mode):
+        env = SCons.Environment.Environment(
+            tools=[], PROTOC_PARTITION=mode, PROTOC_SUFFIX=".proto"
+        )
+        partitions = protoc._partitions(env, self.sources)
+        if partitions is None:
+            return None
+        return [[str(node) for node in part] for part in partitions]
+
+    def test_none(self):
+        self.assertIsNone(self._partitions(""))
+
+    def test_file(self):
+        self.assertEqual(
+            [["a/x.proto"], ["a/y.proto"], ["b/z.proto"], ["c.proto"]],
+            self._partitions("file"),
+        )
+
+    def test_dir(self):
+        self.assertEqual(
+            [["c.proto"], ["a/x.proto", "a/y.proto"], ["b/z.proto"]],
+            self._partitions("dir"),
+        )
+
+    def test_count(self):
+        partitions = self._partitions("2")
+        self.assertLessEqual(len(partitions), 2)
+        self.assertEqual(
+            sorted(["a/x.proto", "a/y.proto", "b/z.proto", "c.proto"]),
+            sorted(sum(partitions, [])),
+        )
+        self.assertEqual(partitions, self._partitions("2"))
+        self.assertEqual(4, len(self._partitions("1000")))
+
+    def test_count_stable(self):
+        # adding a source doesn't move the others to another partition
+        before = self._partitions("3")
+        self.sources = self.sources + ["d.proto"]
+        after = self._partitions("3")
+        for part in after:
+            part = [src for src in part if src != "d.proto"]
+            if part:
+                self.assertIn(part, before)
+
+    def test_invalid(self):
+        for mode in ("files", "0", "-1"):
+            self.assertRaises(SCons.Errors.UserError, self._partitions, mode)
+
+
+class TestSourcesNames(unittest.TestCase):
+    def _names(self, source, protoPath=()):
+        env = SCons.Environment.Environment(
+            tools=[],
+            PROTOC_PATH_FLAGS=" ".join("--proto_path=" + p for p in protoPath),
+        )
+        return protoc._sourcesNames(env, source)
+
+    def test_source_folders(self):
+        self.assertEqual(["c.proto"], self._names(["/src/proto/sub/c.proto"]))
+        # protoc takes the first --proto_path that contains a source
+        self.assertEqual(
+            ["a.proto", "sub/c.proto"],
+            self._names(["/src/proto/a.proto", "/src/proto/sub/c.proto"]),
+        )
+
+    def test_proto_path(self):
+        self.assertEqual(
+            ["a.proto", "sub/c.proto", "other.proto"],
+            self._names(
+                ["/src/proto/a.proto", "/src/proto/sub/c.proto", "/src/other.proto"],
+                ["/src/proto"],
+            ),
+        )
+
+    def test_first_proto_path(self):
+        self.assertEqual(
+            ["c.proto"],
+            self._names(["/src/proto/sub/c.proto"], ["/src/proto/sub", "/src/proto"]),
+        )
+        self.assertEqual(
+            ["sub/c.proto"],
+            self._names(["/src/proto/sub/c.proto"], ["/src/proto", "/src/proto/sub"]),
+        )
+
+    def test_similar_prefix(self):
+        self.assertEqual(
+            ["a.proto"], self._names(["/src/proto2/a.proto"], ["/src/proto"])
+        )
+
+
+class TestParseDepfile(unittest.TestCase):
+    def test_protoc(self):
+        # as written by protoc --dependency_out
+        text = (
+            "build/a.pb.cc \\\n"
+            "build/a.pb.h: proto/b.proto\\\n"
+            " /usr/include/google/protobuf/any.proto\\\n"
+            " proto/a.proto"
+        )
+        self.assertEqual(
+            [
+                "proto/b.proto",
+                "/usr/include/google/protobuf/any.proto",
+                "proto/a.proto",
+            ],
+            protoc._parseDepfile(text),
+        )
+
+    def test_continuations(self):
+        text = "a.pb.h: b.proto \\\r\n  c.proto \\\n\td.proto\n"
+        self.assertEqual(["b.proto", "c.proto", "d.proto"], protoc._parseDepfile(text))
+
+    def test_escaped_spaces(self):
+        text = (
+            "my\\ dir/a.pb.h: my\\ dir/a\\ b.proto\\\n"
+            " other/c\\#1.proto  cost$$.proto\n"
+        )
+        self.assertEqual(
+            ["my dir/a b.proto", "other/c#1.proto", "cost$.proto"],
+            protoc._parseDepfile(text),
+        )
+
+    def test_drive_letters(self):
+        text = "C:\\build\\a.pb.h: C:\\proto\\a.proto D:\\my\\ proto\\b.proto\n"
+        self.assertEqual(
+            ["C:\\proto\\a.proto", "D:\\my proto\\b.proto"],
+            protoc._parseDepfile(text),
+        )
+
+    def test_empty(self):
+        self.assertEqual([], protoc._parseDepfile(""))
+        self.assertEqual([], protoc._parseDepfile("a.pb.h:\n"))
+
+
+class TestDeclarations(unittest.TestCase):
+    def test_declarations(self):
+        text = """
+syntax = "proto3";
+package foo.bar;
+option java_package = "com.example"  ".foo";
+option java_multiple_files = true;
+option (custom) = { a: 1 };
+
+/* message Commented {} */
+message Outer {
+  message Inner {}
+  enum InnerKind { A = 0; }
+  option deprecated = true;
+}
+enum Kind { K = 0; }
+service Greeter { rpc Hello (Outer) returns (Outer); }
+// enum Commented {}
+"""
+        decls = protoc._parseDeclarations(text)
+        self.assertEqual(("Inner", "InnerKind"), decls["nested"])
+        self.assertEqual("foo.bar", decls["package"])
+        self.assertEqual("com.example.foo", decls["options"]["java_package"])
+        self.assertEqual("true", decls["options"]["java_multiple_files"])
+        self.assertNotIn("deprecated", decls["options"])
+        self.assertEqual(("Outer",), decls["message"])
+        self.assertEqual(("Kind",), decls["enum"])
+        self.assertEqual(("Greeter",), decls["service"])
+
+    def test_multi_line_option(self):
+        text = """
+option
+  java_outer_classname
+    =
+  "Multi"  // a comment
+  ;
+"""
+        decls = protoc._parseDeclarations(text)
+        self.assertEqual("Multi", decls["options"]["java_outer_classname"])
+
+    def test_camel_case(self):
+        self.assertEqual("Foo", protoc._underscoresToCamelCase("foo"))
+        self.assertEqual("FooBar", protoc._underscoresToCamelCase("foo_bar"))
+        self.assertEqual("FooBar", protoc._underscoresToCamelCase("foo-bar"))
+        self.assertEqual("Foo2Bar", protoc._underscoresToCamelCase("foo2bar"))
+        self.assertEqual("MyFILE", protoc._underscoresToCamelCase("myFILE"))
+        self.assertEqual("Foo", protoc._underscoresToCamelCase("_foo_"))
+
+
+class TestJavaTargets(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # content signatures would open a .sconsign.dblite in the current
+        # folder otherwise
+        SCons.SConsign.File(None)
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = SCons.Environment.Environment(tools=[])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _targets(self, fileName, contents):
+        # a folder of its own, since nodes remember their content signature
+        folder = tempfile.mkdtemp(dir=self.tmp.name)
+        path = os.path.join(folder, fileName)
+        with open(path, "w") as f:
+            f.write(contents)
+        targets, grpcTargets = protoc._getJavaTargets(
+            self.env, self.env.File(path), "out", ".proto", ".java", "Grpc.java"
+        )
+        return (
+            [os.path.relpath(t, "out").replace(os.sep, "/") for t in targets],
+            [os.path.relpath(t, "out").replace(os.sep, "/") for t in grpcTargets],
+        )
+
+    def test_outer_class(self):
+        self.assertEqual(
+            (["foo/MyFile.java"], []),
+            self._targets("my_file.proto", "package foo;\nmessage Msg {}\n"),
+        )
+
+    def test_outer_class_suffix(self):
+        self.assertEqual(
+            (["MyFileOuterClass.java"], []),
+            self._targets("my_file.proto", "message MyFile {}\n"),
+        )
+        self.assertEqual(
+            (["MyFileOuterClass.java"], ["MyFileGrpc.java"]),
+            self._targets("my_file.proto", "service MyFile {}\n"),
+        )
+        # nested types collide with the outer class as well
+        self.assertEqual(
+            (["MyFileOuterClass.java"], []),
+            self._targets("my_file.proto", "message A { message MyFile {} }\n"),
+        )
+        self.assertEqual(
+            (["MyFileOuterClass.java"], []),
+            self._targets("my_file.proto", "message A { enum MyFile { X = 0; } }\n"),
+        )
+        text = """
+syntax = "proto2";
+message A {
+  optional group MyFile = 1 { optional int32 x = 2; }
+}
+"""
+        self.assertEqual(
+            (["MyFileOuterClass.java"], []), self._targets("my_file.proto", text)
+        )
+        # but not the fields
+        self.assertEqual(
+            (["MyFile.java"], []),
+            self._targets("my_file.proto", "message A { int32 MyFile = 1; }\n"),
+        )
+
+    def test_outer_classname(self):
+        text = """
+package foo;
+option java_package = "com.example";
+option java_outer_classname = "Names";
+message Names {}
+"""
+        self.assertEqual(
+            (["com/example/Names.java"], []), self._targets("a.proto", text)
+        )
+
+    def test_multiple_files(self):
+        text = """
+package foo;
+option java_multiple_files = true;
+message A { message Nested {} enum NestedKind { N = 0; } }
+message B {}
+enum Kind { K = 0; }
+service Greeter {}
+"""
+        self.assertEqual(
+            (
+                [
+                    "foo/A.java",
+                    "foo/AOrBuilder.java",
+                    "foo/B.java",
+                    "foo/BOrBuilder.java",
+                    "foo/Kind.java",
+                    "foo/Types.java",
+                ],
+                ["foo/GreeterGrpc.java"],
+            ),
+            self._targets("types.proto", text),
+        )
+
+    def test_generic_services(self):
+        text = """
+option java_multiple_files = true;
+option java_generic_services = true;
+service Greeter {}
+"""
+        self.assertEqual(
+            (["Greeter.java", "Services.java"], ["GreeterGrpc.java"]),
+            self._targets("services.proto", text),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,152 +10,273 @@ Modified by Bassem Girgis
 """
 
 
+import atexit
 import os
+import pickle
+import re
+import zlib
+import SCons.Errors
+import SCons.Node
+import SCons.Node.FS
+import SCons.Scanner
 import SCons.Util
 from SCons.Script import Builder, Action, File, Dir
 
 protocs = ["protoc"]
 
 
-def _removeAll(arrList, val):
-    while val in arrList:
-        arrList.remove(val)
-    return arrList
+class _ProtocCache:
+    """
+    A dictionary of named sections that gets pickled to the file given by
+    PROTOC_CACHEFILE, such that a no-op build doesn't have to parse the
+    same files again. Every entry remembers the last "generation" (number
+    of saves) in which it was used, entries that weren't used for a while
+    get dropped on the next save.
+    """
+
+    version = 2
+    keep_generations = 20
+
+    def __init__(self, path):
+        self.path = path
+        self.dirty = False
+        self.generation = 0
+        self.sections = {}
+        if not path:
+            return
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+            if data["version"] == self.version:
+                self.generation = data["generation"] + 1
+                self.sections = data["sections"]
+        except Exception:
+            # no cache yet, or an unreadable one
+            pass
+
+    def get(self, section, key):
+        try:
+            entry = self.sections[section][key]
+        except KeyError:
+            return None
+        if entry[0] != self.generation:
+            self.sections[section][key] = (self.generation, entry[1])
+        return entry[1]
+
+    def put(self, section, key, value):
+        self.sections.setdefault(section, {})[key] = (self.generation, value)
+        self.dirty = True
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        oldest = self.generation - self.keep_generations
+        for section in self.sections.values():
+            for key in [k for k, e in section.items() if e[0] < oldest]:
+                del section[key]
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(
+                    {
+                        "version": self.version,
+                        "generation": self.generation,
+                        "sections": self.sections,
+                    },
+                    f,
+                    pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmp, self.path)
+            self.dirty = False
+        except (OSError, pickle.PickleError):
+            pass
+
+
+# the _ProtocCache for each PROTOC_CACHEFILE, also by the value of
+# the variable and the current SConscript folder
+_caches = {}
+_cachesByValue = {}
+
+
+def _getCache(env):
+    key = (env.get("PROTOC_CACHEFILE"), env.fs.getcwd())
+    try:
+        return _cachesByValue[key]
+    except (KeyError, TypeError):
+        pass
+    path = env.subst("$PROTOC_CACHEFILE")
+    if path:
+        path = env.File(path).get_abspath()
+    cache = _caches.get(path)
+    if cache is None:
+        cache = _ProtocCache(path)
+        _caches[path] = cache
+    try:
+        _cachesByValue[key] = cache
+    except TypeError:
+        # not hashable, like a list
+        pass
+    return cache
+
+
+def _saveCaches():
+    for cache in _caches.values():
+        cache.save()
+
+
+atexit.register(_saveCaches)
+
+
+# whitespace and comments get skipped, all other tokens are strings,
+# (dotted) identifiers or single characters
+_tokenRe = re.compile(
+    r"\s+|//[^\n]*|/\*.*?(?:\*/|\Z)"
+    r"|(?P<string>\"(?:[^\"\\\n]|\\.)*\"|'(?:[^'\\\n]|\\.)*')"
+    r"|(?P<word>[A-Za-z_][\w.]*)"
+    r"|(?P<char>.)",
+    re.S,
+)
+
+_declarationKinds = ("message", "enum", "service")
+
+
+def _parseDeclarations(contents):
+    """
+    Return the package, the file options, the names of the top-level
+    messages, enums and services, and the names of the nested messages
+    and enums of the given .proto contents
+    """
+    decls = {"package": "", "options": {}, "nested": []}
+    for kind in _declarationKinds:
+        decls[kind] = []
+
+    depth = 0
+    statement = []
+    for m in _tokenRe.finditer(contents):
+        kind = m.lastgroup
+        if kind is None:
+            continue
+        token = m.group(kind)
+        if token == "{" and kind == "char":
+            decl = _blockDeclaration(statement)
+            if decl is not None:
+                keyword, name = decl
+                if depth == 0:
+                    decls[keyword].append(name)
+                elif keyword != "service":
+                    decls["nested"].append(name)
+            depth += 1
+            statement = []
+        elif token == "}" and kind == "char":
+            depth = max(depth - 1, 0)
+            statement = []
+        elif token == ";" and kind == "char":
+            if depth == 0:
+                _addStatement(decls, statement)
+            statement = []
+        else:
+            statement.append((kind, token))
+
+    for kind in _declarationKinds + ("nested",):
+        decls[kind] = tuple(decls[kind])
+    return decls
+
+
+def _blockDeclaration(statement):
+    """The keyword and the name of the type a block declares, if any"""
+    if len(statement) == 2:
+        (_, keyword), (nameKind, name) = statement
+        if keyword in _declarationKinds and nameKind == "word":
+            return keyword, name
+    # a proto2 group is a nested message, like "optional group Name = 1 {"
+    for i in range(len(statement) - 2):
+        if statement[i] == ("word", "group") and statement[i + 1][0] == "word":
+            if statement[i + 2] == ("char", "="):
+                return "message", statement[i + 1][1]
+    return None
+
+
+def _addStatement(decls, statement):
+    """Record a top-level package or option statement"""
+    if len(statement) < 2 or statement[1][0] != "word":
+        return
+    keyword, name = statement[0][1], statement[1][1]
+    if keyword == "package":
+        decls["package"] = name
+        return
+    if keyword != "option" or len(statement) < 4 or statement[2] != ("char", "="):
+        return
+    value = statement[3:]
+    if all(kind == "string" for kind, _ in value):
+        # adjacent string literals get concatenated
+        decls["options"][name] = "".join(token[1:-1] for _, token in value)
+    elif len(value) == 1:
+        decls["options"][name] = value[0][1]
+
+
+def _getDeclarations(env, node):
+    """The declarations of a .proto file, memoized by its content signature"""
+    if not node.rexists():
+        return _parseDeclarations("")
+    cache = _getCache(env)
+    csig = node.get_csig()
+    decls = cache.get("declarations", csig)
+    if decls is None:
+        decls = _parseDeclarations(node.get_text_contents())
+        cache.put("declarations", csig, decls)
+    return decls
+
+
+def _underscoresToCamelCase(name):
+    """The class name protoc derives from a file name"""
+    result = []
+    capNext = True
+    for c in name:
+        if "a" <= c <= "z":
+            result.append(c.upper() if capNext else c)
+            capNext = False
+        elif "A" <= c <= "Z":
+            result.append(c)
+            capNext = False
+        elif "0" <= c <= "9":
+            result.append(c)
+            capNext = True
+        else:
+            capNext = True
+    return "".join(result)
 
 
 def _getJavaTargets(
-    filePath, outPath, protoc_suffix, protoc_java_suffix, protoc_grpc_java_suffix
+    env, node, outPath, protoc_suffix, protoc_java_suffix, protoc_grpc_java_suffix
 ):
-    isMultiFile = False
-    isJavaPackage = False
-    packagePath = ""
-    outerClassName = (
-        os.path.basename(filePath).replace(protoc_suffix, "").title().replace("_", "")
+    decls = _getDeclarations(env, node)
+    options = decls["options"]
+
+    # option java_multiple_files = true;
+    # in this case the generated files are two files per message, one
+    # per enum and one file for the package
+    isMultiFile = options.get("java_multiple_files") == "true"
+
+    # option java_package = "io.grpc.examples.helloworld";
+    # the path to which the files are generated matches the given
+    # dot-notation path. This option overrides the package statement.
+    packagePath = (options.get("java_package") or decls["package"]).replace(
+        ".", os.path.sep
     )
-    messages = []
-    services = []
-
-    # search the file for java specific options.
-    with open(filePath, "r") as srcfile:
-        for line in srcfile:
-
-            # take the non-comment part from the line and strip away any padding
-            line_s = line.split("//")[0].strip()
-
-            # the case of empty lines
-            if not line_s:
-                continue
-
-            # trying to handle:
-            # option java_multiple_files = true;
-            # in this case the generated files are two files per message and
-            # one file for the package
-            if all(
-                [
-                    line_s.startswith("option java_multiple_files"),
-                    "true" in line_s,  # value has to be "true".
-                    '"' not in line_s,  # literals are
-                    "'" not in line_s,  # not allowed.
-                    "=" in line_s,  # it has to be
-                    ";" in line_s,
-                ]
-            ):  # a valid statement.
-                isMultiFile = True
-                continue
-
-            # trying to handle the optional package switch:
-            # option java_package = "io.grpc.examples.helloworld";
-            # in this case, the path to which the files are generated matches
-            # the given dot-notation path. This option overrides the package
-            # option
-            if all(
-                [
-                    line_s.startswith("option java_package"),
-                    ('"' in line_s or "'" in line_s),  # the path has to be a literal.
-                    "=" in line_s,  # it has to be
-                    ";" in line_s,
-                ]
-            ):  # a valid statement.
-                packagePath = (
-                    line_s.split("=")[1]
-                    .replace('"', "")
-                    .replace("'", "")
-                    .replace(";", "")
-                    .replace(".", os.path.sep)
-                    .strip()
-                )
-                isJavaPackage = True
-                continue
-
-            # trying to handle the package option only when java_package is not
-            # given:
-            # package helloworld;
-            if all(
-                [
-                    not isJavaPackage,
-                    line_s.startswith("package"),
-                    '"' not in line_s,  # package is
-                    "'" not in line_s,  # not a literal.
-                    "=" not in line_s,  # not a valid
-                    ";" in line_s,
-                ]
-            ):  # assignment statement.
-                packagePath = (
-                    _removeAll(line_s.split(" "), "")[-1]
-                    .replace(";", "")
-                    .replace(".", os.path.sep)
-                    .strip()
-                )
-                continue
-
-            # trying to handle the outer class option:
-            # option java_outer_classname = "HelloWorldProto";
-            # this option overrides the default which is the same as proto
-            # file name but with first character capital.
-            if all(
-                [
-                    line_s.startswith("option java_outer_classname"),
-                    ('"' in line_s or "'" in line_s),  # the value has to be a literal.
-                    "=" in line_s,  # it has to be
-                    ";" in line_s,
-                ]
-            ):  # a valid statement.
-                outerClassName = (
-                    line_s.split("=")[1]
-                    .replace('"', "")
-                    .replace("'", "")
-                    .replace(";", "")
-                    .strip()
-                )
-                continue
-
-            # collect a list of all defined messages:
-            # message HelloRequest {
-            if all(
-                [
-                    line_s.startswith("message "),
-                    '"' not in line_s,  # there is
-                    "'" not in line_s,  # no literals.
-                    "=" not in line_s,  # not a valid
-                    ";" not in line_s,
-                ]
-            ):  # assignment statement.
-                messages.append(_removeAll(line_s.split(" "), "")[1])
-                continue
-
-            # collect a list of all defined services:
-            # service Greeter {
-            if all(
-                [
-                    line_s.startswith("service "),
-                    '"' not in line_s,  # there is
-                    "'" not in line_s,  # no literals.
-                    "=" not in line_s,  # not a valid
-                    ";" not in line_s,
-                ]
-            ):  # assignment statement.
-                services.append(_removeAll(line_s.split(" "), "")[1])
-                continue
+
+    # option java_outer_classname = "HelloWorldProto";
+    # this option overrides the default, which is the camel-cased file
+    # name, with "OuterClass" appended if a top-level type has that name
+    outerClassName = options.get("java_outer_classname")
+    if not outerClassName:
+        fileName = os.path.basename(node.get_path())
+        if fileName.endswith(protoc_suffix):
+            fileName = fileName[: -len(protoc_suffix)]
+        outerClassName = _underscoresToCamelCase(fileName)
+        if any(
+            outerClassName in decls[kind] for kind in _declarationKinds + ("nested",)
+        ):
+            outerClassName += "OuterClass"
 
     def _append(listObj, fileName, suffix):
         if packagePath:
@@ -167,12 +288,17 @@ def _getJavaTargets(
     grpcTargets = []
 
     if isMultiFile:
-        for msg in messages:
+        for msg in decls["message"]:
             _append(targets, msg, protoc_java_suffix)
             _append(targets, msg + "OrBuilder", protoc_java_suffix)
+        for enum in decls["enum"]:
+            _append(targets, enum, protoc_java_suffix)
+        if options.get("java_generic_services") == "true":
+            for srvc in decls["service"]:
+                _append(targets, srvc, protoc_java_suffix)
 
-    for srcv in services:
-        _append(grpcTargets, srcv, protoc_grpc_java_suffix)
+    for srvc in decls["service"]:
+        _append(grpcTargets, srvc, protoc_grpc_java_suffix)
 
     _append(targets, outerClassName, protoc_java_suffix)
 
@@ -265,6 +391,45 @@ def _getIncludes(env):
     return [path.strip() for path in env["PROTOC_PATH_FLAGS"].split("--proto_path=")]
 
 
+def _sourcesPathFlags(env, source):
+    """The --proto_path flags for the folders of the sources"""
+    includePath = _getIncludes(env)
+    protoPath = []
+    for src in source:
+        srcDir = os.path.dirname(os.path.abspath(str(src)))
+        if srcDir not in includePath and srcDir not in protoPath:
+            protoPath.append(srcDir)
+
+    # flag --proto_path, -I
+    flags = SCons.Util.CLVar("")
+    for path in protoPath:
+        flags.append("--proto_path=" + path)
+    return str(flags)
+
+
+def _sourcesNames(env, source):
+    """
+    The names protoc gives the sources: their paths relative to the first
+    proto path that contains them, from PROTOC_PATH and then the folders of
+    the sources, in the order of the --proto_path flags
+    """
+    protoPath = [path for path in _getIncludes(env) if path]
+    for src in source:
+        srcDir = os.path.dirname(os.path.abspath(str(src)))
+        if srcDir not in protoPath:
+            protoPath.append(srcDir)
+
+    names = []
+    for src in source:
+        srcPath = os.path.abspath(str(src))
+        for path in protoPath:
+            name = os.path.relpath(srcPath, path)
+            if name != os.pardir and not name.startswith(os.pardir + os.sep):
+                break
+        names.append(name.replace(os.sep, "/"))
+    return names
+
+
 def _protoc_emitter(target, source, env):
     """Process target, sources, and flags"""
 
@@ -294,18 +459,12 @@ def _protoc_emitter(target, source, env):
     protoc_java_suffix = env.subst("$PROTOC_JAVASUFFIX")
     protoc_grpc_java_suffix = env.subst("$PROTOC_GRPC_JAVASUFFIX")
 
-    includePath = _getIncludes(env)
-    protoPath = []
+    # protoc writes the files of sources in a sub-folder of a proto path
+    # to the same sub-folder of the output folders
+    names = _sourcesNames(env, source)
 
     # produce proper targets
-    for src in source:
-        srcPath = os.path.abspath(str(src))
-        srcDir = os.path.dirname(srcPath)
-        srcName = os.path.basename(srcPath)
-
-        if srcDir not in includePath and srcDir not in protoPath:
-            protoPath.append(srcDir)
-
+    for src, srcName in zip(source, names):
         # create stem by remove the $PROTOC_SUFFIX or take a guess
         if srcName.endswith(protoc_suffix):
             stem = srcName[: -len(protoc_suffix)]
@@ -342,7 +501,8 @@ def _protoc_emitter(target, source, env):
         if env["PROTOC_JAVAOUT"]:
             out = env["PROTOC_JAVAOUT"]
             _1, _2 = _getJavaTargets(
-                srcPath,
+                env,
+                src,
                 out.abspath,
                 protoc_suffix,
                 protoc_java_suffix,
@@ -352,15 +512,18 @@ def _protoc_emitter(target, source, env):
             if env["PROTOC_GRPC_JAVA"]:
                 target += _2
 
-    # flag --proto_path, -I
-    flags = SCons.Util.CLVar("")
-    for path in protoPath:
-        flags.append(
-            "--proto_path=" + (path if isinstance(path, str) else str(path.abspath))
-        )
-
     # updated flags
-    env["PROTOC_SOURCES_PATH_FLAGS"] = str(flags)
+    env["PROTOC_SOURCES_PATH_FLAGS"] = _sourcesPathFlags(env, source)
+    env["PROTOC_SOURCES_NAMES"] = names
+
+    depfile = _depfile(env, target, source)
+    if depfile is not None:
+        env.Clean(target, depfile)
+
+    # substituting all the targets and sources is expensive for
+    # large calls, so don't do it unless it gets printed
+    if not isDebug:
+        return target, source
 
     _print("-" * 50)
     _print(
@@ -392,13 +555,363 @@ def _protoc_emitter(target, source, env):
     return target, source
 
 
+# comments and string literals get stepped over, such that only real
+# import statements are found
+# import statements may have comments between their tokens
+_importSpace = r"(?:\s|//[^\n]*|/\*.*?\*/)*"
+_importRe = re.compile(
+    r"(?P<comment>//[^\n]*|/\*.*?\*/)"
+    r"|\bimport" + _importSpace + r"(?:(?:public|weak)\b" + _importSpace + r")?"
+    r"(?P<quote>[\"'])(?P<import>[^\"'\n]+)(?P=quote)" + _importSpace + r";"
+    r"|(?P<string>\"(?:[^\"\\\n]|\\.)*\"|'(?:[^'\\\n]|\\.)*')",
+    re.S,
+)
+
+
+def _parseImports(contents):
+    """Return the names of all files imported by the given .proto contents"""
+    return tuple(
+        m.group("import") for m in _importRe.finditer(contents) if m.group("import")
+    )
+
+
+# the imports of a .proto file, by its content signature
+_importsMemo = {}
+
+
+def _getImports(node):
+    csig = node.get_csig()
+    try:
+        return _importsMemo[csig]
+    except KeyError:
+        pass
+    imports = _parseImports(node.get_text_contents())
+    _importsMemo[csig] = imports
+    return imports
+
+
+def _depfile(env, target, source):
+    """
+    The dependency file protoc writes for the given targets, or None.
+    protoc writes one for a single source only, and not when reading
+    a descriptor set.
+    """
+    if not target or len(source) != 1 or env.get("PROTOC_DESCRIPTOR_SET_IN_FLAGS"):
+        return None
+    try:
+        if int(env.subst("$PROTOC_DEPFILE")) == 0:
+            return None
+    except ValueError:
+        return None
+    # the emitter returns the Java targets as paths
+    return env.File(target[0]).get_abspath() + env.subst("$PROTOC_DEPFILE_SUFFIX")
+
+
+def _depfileFlags(env, target, source):
+    """The --dependency_out flag, if protoc writes a dependency file"""
+    depfile = _depfile(env, target, source)
+    if depfile is None:
+        return ""
+    return "--dependency_out=" + depfile
+
+
+_depfileRuleRe = re.compile(r":(?:\s|$)")
+# prerequisites are separated by whitespace that isn't escaped
+_depfileSplitRe = re.compile(r"(?<!\\)\s+")
+
+
+def _parseDepfile(text):
+    """Return the prerequisites in a Makefile style dependency file"""
+    text = text.replace("\\\r\n", " ").replace("\\\n", " ")
+    deps = []
+    for line in text.splitlines():
+        # the targets may start with a drive letter, like 'C:\\...'
+        m = _depfileRuleRe.search(line)
+        if not m:
+            continue
+        for dep in _depfileSplitRe.split(line[m.end() :].strip()):
+            if dep:
+                deps.append(
+                    dep.replace("\\ ", " ").replace("\\#", "#").replace("$$", "$")
+                )
+    return deps
+
+
+def _depfileDeps(env, depfile):
+    """
+    The files listed in the given dependency file, as a tuple of absolute
+    paths, or None if there is no such file.
+    """
+    try:
+        st = os.stat(depfile)
+    except OSError:
+        return None
+    stamp = (st.st_mtime, st.st_size)
+    cache = _getCache(env)
+    entry = cache.get("depfiles", depfile)
+    if entry is not None and entry[0] == stamp:
+        return entry[1]
+    try:
+        with open(depfile, "r") as f:
+            text = f.read()
+    except (IOError, OSError):
+        return None
+    top = env.Dir("#").get_abspath()
+    deps = tuple(os.path.normpath(os.path.join(top, d)) for d in _parseDepfile(text))
+    cache.put("depfiles", depfile, (stamp, deps))
+    return deps
+
+
+def _depfileExtra(node, env, deps):
+    """
+    The files of deps that aren't among the sources and the dependencies
+    of the target node yet, sorted by their paths
+    """
+    known = set(src.get_abspath() for src in node.sources)
+    known.update(dep.get_abspath() for dep in node.implicit or [])
+    extra = []
+    for dep in sorted(set(deps) - known):
+        depNode = env.File(dep)
+        if depNode.is_derived() or depNode.rexists():
+            extra.append(depNode)
+    return extra
+
+
+def _recordDeps(target, source, env):
+    """
+    Read the new dependency file right away, and add the files the
+    scanner didn't find to the dependencies that get stored for the
+    targets, in the same order as the target scanner returns them in
+    the next build, such that the targets are up to date then
+    """
+    depfile = _depfile(env, target, source)
+    if depfile is None:
+        return 0
+    deps = _depfileDeps(env, depfile)
+    if deps:
+        for tgt in target:
+            tgt.add_to_implicit(_depfileExtra(tgt, env, deps))
+    return 0
+
+
+def _protoc_scan(node, env, path):
+    """Find the imported files of a .proto file"""
+    if not node.rexists():
+        return []
+    deps = []
+    for name in _getImports(node):
+        dep = SCons.Node.FS.find_file(name, path)
+        if dep is not None:
+            deps.append(dep)
+    return deps
+
+
+_protocPathDirs = SCons.Scanner.FindPathDirs("PROTOC_PATH")
+
+
+def _protoc_scan_path(env, dir, target=None, source=None):
+    """The PROTOC_PATH, followed by the directories of the sources"""
+    paths = list(_protocPathDirs(env, dir, target, source))
+    for src in source or []:
+        srcDir = src.get_dir()
+        if srcDir not in paths:
+            paths.append(srcDir)
+    return tuple(paths)
+
+
+_protoc_scanner = SCons.Scanner.Scanner(
+    function=_protoc_scan,
+    name="ProtocScanner",
+    skeys=["$PROTOC_SUFFIX"],
+    path_function=_protoc_scan_path,
+    recursive=True,
+)
+
+
+def _protoc_depfile_scan(node, env, path):
+    """
+    The files in the dependency file of the last protoc run that the
+    scanner doesn't find, like the well-known types that come with protoc
+    """
+    depfile = path[0]
+    if depfile is None:
+        return []
+    deps = _depfileDeps(env, depfile)
+    if not deps:
+        return []
+    return _depfileExtra(node, env, deps)
+
+
+def _protoc_depfile_path(env, dir, target=None, source=None):
+    """The dependency file of the targets"""
+    if not target or not source:
+        return (None,)
+    return (_depfile(env, target, source),)
+
+
+_protoc_depfile_scanner = SCons.Scanner.Scanner(
+    function=_protoc_depfile_scan,
+    name="ProtocDepfileScanner",
+    path_function=_protoc_depfile_path,
+)
+
+
 _protoc_builder = Builder(
-    action=Action("$PROTOC_COM", "$PROTOC_COMSTR"),
+    action=[Action("$PROTOC_COM", "$PROTOC_COMSTR"), Action(_recordDeps, None)],
     suffix="$PROTOC_CCSUFFIX",
     src_suffix="$PROTOC_SUFFIX",
     emitter=_protoc_emitter,
+    source_scanner=_protoc_scanner,
+    target_scanner=_protoc_depfile_scanner,
 )
 
+# the same targets, but generated from the binary descriptor sets
+# in PROTOC_DESCRIPTOR_SET_IN instead of the .proto files
+_protoc_set_in_builder = Builder(
+    action=Action("$PROTOC_DESCRIPTOR_SET_IN_COM", "$PROTOC_DESCRIPTOR_SET_IN_COMSTR"),
+    suffix="$PROTOC_CCSUFFIX",
+    src_suffix="$PROTOC_SUFFIX",
+    emitter=_protoc_emitter,
+)
+
+
+def _protoc_descriptor_set_emitter(target, source, env):
+    """Process the path flags for a descriptor set"""
+    _checkEnv(env)
+    env["PROTOC_SOURCES_PATH_FLAGS"] = _sourcesPathFlags(env, source)
+    depfile = _depfile(env, target, source)
+    if depfile is not None:
+        env.Clean(target, depfile)
+    return target, source
+
+
+_protoc_descriptor_set_builder = Builder(
+    action=[
+        Action("$PROTOC_DESCRIPTOR_SET_COM", "$PROTOC_DESCRIPTOR_SET_COMSTR"),
+        Action(_recordDeps, None),
+    ],
+    suffix="$PROTOC_DESCRIPTOR_SET_SUFFIX",
+    src_suffix="$PROTOC_SUFFIX",
+    emitter=_protoc_descriptor_set_emitter,
+    source_scanner=_protoc_scanner,
+    target_scanner=_protoc_depfile_scanner,
+)
+
+
+def _descriptorSetIn(env):
+    """The descriptor sets given by PROTOC_DESCRIPTOR_SET_IN, as nodes"""
+    sets = env.get("PROTOC_DESCRIPTOR_SET_IN")
+    if not sets:
+        return []
+    return env.arg2nodes(SCons.Util.flatten(sets), env.fs.File)
+
+
+def _partitions(env, source):
+    """Split the sources as selected by PROTOC_PARTITION, or return None"""
+    mode = env.subst("$PROTOC_PARTITION")
+    if not mode:
+        return None
+
+    suffix = env.subst("$PROTOC_SUFFIX")
+    nodes = []
+    for src in SCons.Util.flatten(source):
+        # the same suffix handling as for the sources of a builder
+        if SCons.Util.is_String(src) and not SCons.Util.splitext(src)[1]:
+            src = src + suffix
+        nodes.extend(env.arg2nodes(src, env.fs.File))
+
+    if mode == "file":
+        return [[node] for node in nodes]
+
+    if mode == "dir":
+        partitions = {}
+        for node in nodes:
+            partitions.setdefault(node.get_dir(), []).append(node)
+        return [partitions[key] for key in sorted(partitions, key=str)]
+
+    try:
+        count = int(mode)
+    except ValueError:
+        count = 0
+    if count < 1:
+        raise SCons.Errors.UserError(
+            "PROTOC_PARTITION has to be 'file', 'dir' or a number of partitions, "
+            "not '%s'" % mode
+        )
+    # a file always lands in the same partition, such that adding or
+    # removing a file changes the one partition it belongs to only
+    partitions = {}
+    for node in nodes:
+        key = zlib.crc32(node.get_path().encode("utf-8")) % count
+        partitions.setdefault(key, []).append(node)
+    return [partitions[key] for key in sorted(partitions)]
+
+
+def _protoc(env, target=None, source=None, *args, **kwargs):
+    """
+    A pseudo-Builder wrapper around _protoc_builder. With PROTOC_PARTITION,
+    protoc runs once per partition of the sources, each with its own list
+    of targets. With PROTOC_DESCRIPTOR_SET_IN, the files get generated from
+    the given descriptor sets, instead of parsing the sources again.
+    """
+    if source is None:
+        source = target
+        target = None
+    if target is not None and not SCons.Util.is_List(target):
+        target = [target]
+    if source is None:
+        source = []
+    elif not SCons.Util.is_List(source):
+        source = [source]
+
+    overrides = env.Override(kwargs)
+    builder = _protoc_builder
+    descriptorSets = _descriptorSetIn(overrides)
+    if descriptorSets:
+        builder = _protoc_set_in_builder
+        kwargs["PROTOC_DESCRIPTOR_SET_IN_FLAGS"] = "--descriptor_set_in=" + os.pathsep.join(
+            node.get_abspath() for node in descriptorSets
+        )
+
+    # every call, and every partition, needs an environment of its own,
+    # since the emitter stores the --proto_path flags for its sources there
+    kwargs.setdefault("PROTOC_SOURCES_PATH_FLAGS", SCons.Util.CLVar(""))
+
+    partitions = _partitions(overrides, source)
+    if partitions is None:
+        result = builder(env, target, source, *args, **kwargs)
+    else:
+        result = []
+        for part in partitions:
+            result.extend(builder(env, None, part, *args, **kwargs))
+        result = SCons.Node.NodeList(result)
+
+    if descriptorSets:
+        env.Depends(result, descriptorSets)
+    return result
+
+
+def _protocDescriptorSet(env, target=None, source=None, *args, **kwargs):
+    """
+    A pseudo-Builder wrapper around _protoc_descriptor_set_builder, that
+    parses the sources once and writes them, with all their imports, to
+    a binary descriptor set.
+    """
+    if source is None:
+        source = target
+        target = None
+    if target is not None and not SCons.Util.is_List(target):
+        target = [target]
+    if source is None:
+        source = []
+    elif not SCons.Util.is_List(source):
+        source = [source]
+
+    # the emitter stores the --proto_path flags for the sources
+    # in an environment of its own
+    kwargs.setdefault("PROTOC_SOURCES_PATH_FLAGS", SCons.Util.CLVar(""))
+    return _protoc_descriptor_set_builder(env, target, source, *args, **kwargs)
+
 
 def _multiGet(kwd, defaultVal, kwargs, env):
     return kwargs.get(kwd) or env.get(kwd) or defaultVal
@@ -423,11 +936,40 @@ def generate(env, **kwargs):
             "PROTOC_SOURCES_PATH_FLAGS", SCons.Util.CLVar(""), env, kwargs
         ),
         PROTOC_PATH=_multiGet("PROTOC_PATH", SCons.Util.CLVar(""), env, kwargs),
+        # parsed dependency files and .proto declarations get remembered
+        # here between runs, if set
+        PROTOC_CACHEFILE=_multiGet("PROTOC_CACHEFILE", "", env, kwargs),
+        # Run protoc once per 'file', 'dir' or for N partitions of the sources
+        PROTOC_PARTITION=_multiGet("PROTOC_PARTITION", "", env, kwargs),
         # Suffixies / prefixes
         PROTOC_SUFFIX=_multiGet("PROTOC_SUFFIX", ".proto", env, kwargs),
         # Protoc command
-        PROTOC_COM="$PROTOC $PROTOC_FLAGS $PROTOC_PATH_FLAGS $PROTOC_SOURCES_PATH_FLAGS $SOURCES.abspath",
-        PROTOC_COMSTR="$PROTOC $PROTOC_FLAGS $PROTOC_PATH_FLAGS $PROTOC_SOURCES_PATH_FLAGS $SOURCES.abspath",
+        PROTOC_COM="$PROTOC $PROTOC_FLAGS $PROTOC_PATH_FLAGS $PROTOC_SOURCES_PATH_FLAGS $( $_PROTOC_DEPFILE_FLAGS $) $SOURCES.abspath",
+        PROTOC_COMSTR="$PROTOC $PROTOC_FLAGS $PROTOC_PATH_FLAGS $PROTOC_SOURCES_PATH_FLAGS $_PROTOC_DEPFILE_FLAGS $SOURCES.abspath",
+        ###############
+        # Dependency files
+        ###############
+        # If set to 1, protoc writes the files it read for a single source,
+        # which get used as the dependencies of the next build
+        PROTOC_DEPFILE=kwargs.get("PROTOC_DEPFILE", 1),
+        PROTOC_DEPFILE_SUFFIX=_multiGet("PROTOC_DEPFILE_SUFFIX", ".d", env, kwargs),
+        _protocDepfileFlags=_depfileFlags,
+        _PROTOC_DEPFILE_FLAGS="${_protocDepfileFlags(__env__, TARGETS, SOURCES)}",
+        ###############
+        # Descriptor sets
+        ###############
+        PROTOC_DESCRIPTOR_SET_SUFFIX=_multiGet(
+            "PROTOC_DESCRIPTOR_SET_SUFFIX", ".protoset", env, kwargs
+        ),
+        PROTOC_DESCRIPTOR_SET_COM="$PROTOC $PROTOC_PATH_FLAGS $PROTOC_SOURCES_PATH_FLAGS $( $_PROTOC_DEPFILE_FLAGS $) --include_imports --descriptor_set_out=$TARGET.abspath $SOURCES.abspath",
+        PROTOC_DESCRIPTOR_SET_COMSTR="$PROTOC $PROTOC_PATH_FLAGS $PROTOC_SOURCES_PATH_FLAGS $_PROTOC_DEPFILE_FLAGS --include_imports --descriptor_set_out=$TARGET.abspath $SOURCES.abspath",
+        # input descriptor set(s) for the Protoc builder
+        PROTOC_DESCRIPTOR_SET_IN=_multiGet("PROTOC_DESCRIPTOR_SET_IN", "", env, kwargs),
+        PROTOC_DESCRIPTOR_SET_IN_FLAGS=SCons.Util.CLVar(""),
+        # the names of the sources in the descriptor sets, set by the emitter
+        PROTOC_SOURCES_NAMES=[],
+        PROTOC_DESCRIPTOR_SET_IN_COM="$PROTOC $PROTOC_FLAGS $PROTOC_DESCRIPTOR_SET_IN_FLAGS $PROTOC_SOURCES_NAMES",
+        PROTOC_DESCRIPTOR_SET_IN_COMSTR="$PROTOC $PROTOC_FLAGS $PROTOC_DESCRIPTOR_SET_IN_FLAGS $PROTOC_SOURCES_NAMES",
         ###############
         # C++
         ###############
@@ -468,7 +1010,11 @@ def generate(env, **kwargs):
         PROTOC_JAVAOUT=_multiGet("PROTOC_JAVAOUT", "", env, kwargs),
     )
 
+    # the plain builder stays in BUILDERS, but env.Protoc() is the
+    # pseudo-builder, which gets added after it
     env["BUILDERS"]["Protoc"] = _protoc_builder
+    env.AddMethod(_protoc, "Protoc")
+    env.AddMethod(_protocDescriptorSet, "ProtocDescriptorSet")
 
 
 def exists(env):
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2001-2010,2011,2012 The SCons Foundation
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+"""
+Generates the C++ files from a descriptor set, for a source in a
+sub-folder of the proto path as well. Its files go to the same
+sub-folder of the output folder.
+"""
+
+import TestSCons
+
+test = TestSCons.TestSCons()
+if not test.where_is('protoc'):
+    test.skip_test("Could not find 'protoc', skipping test.\n")
+
+test.dir_fixture("image")
+test.file_fixture('../../__init__.py','site_scons/site_tools/protoc/__init__.py')
+test.run(arguments = '.')
+
+test.must_exist(test.workpath('build', 'all.protoset'))
+test.must_exist(test.workpath('build', 'a.pb.cc'))
+test.must_exist(test.workpath('build', 'sub', 'c.pb.cc'))
+test.must_contain_all_lines(test.stdout(), [' a.proto', ' sub/c.proto'])
+test.up_to_date(arguments = '.')
+
+test.pass_test()
+
+# Local Variables:
+# tab-width:4
+# indent-tabs-mode:nil
+# End:
+# vim: set expandtab tabstop=4 shiftwidth=4:
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2001-2010,2011,2012 The SCons Foundation
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+"""
+Checks that the outputs of a .proto file get rebuilt when a file it
+imports changes, once with the dependencies from protoc's dependency
+file and once with the ones found by the import scanner only. The file
+imports one of the well-known types as well, which only shows up in the
+dependency file, and the build has to be up to date right after the
+first run nevertheless.
+"""
+
+import TestSCons
+
+test = TestSCons.TestSCons()
+if not test.where_is('protoc'):
+    test.skip_test("Could not find 'protoc', skipping test.\n")
+
+test.dir_fixture("image")
+test.file_fixture('../../__init__.py','site_scons/site_tools/protoc/__init__.py')
+
+common = """\
+syntax = "proto3";
+
+message Common {
+  string name = 1;
+  int32 id = %d;
+}
+"""
+
+for depfile, id in (('1', 2), ('0', 3)):
+    args = 'depfile=%s .' % depfile
+    test.run(arguments = args)
+    test.must_exist(test.workpath('build', 'a.pb.cc'))
+    test.up_to_date(arguments = args)
+
+    test.write(['proto', 'common.proto'], common % id)
+    test.not_up_to_date(arguments = args)
+    test.up_to_date(arguments = args)
+
+test.pass_test()
+
+# Local Variables:
+# tab-width:4
+# indent-tabs-mode:nil
+# End:
+# vim: set expandtab tabstop=4 shiftwidth=4:
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2001-2010,2011,2012 The SCons Foundation
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+"""
+Runs the Protoc() builder with each of the PROTOC_PARTITION modes, and
+checks that changing a source reruns protoc for its own partition only.
+"""
+
+import TestSCons
+
+test = TestSCons.TestSCons()
+if not test.where_is('protoc'):
+    test.skip_test("Could not find 'protoc', skipping test.\n")
+
+test.dir_fixture("image")
+test.file_fixture('../../__init__.py','site_scons/site_tools/protoc/__init__.py')
+
+proto = """\
+syntax = "proto3";
+
+message A {
+  string name = 1;
+  int32 id = %d;
+}
+"""
+
+for mode, id in (('file', 2), ('dir', 3), ('2', 4)):
+    args = 'partition=%s .' % mode
+    test.run(arguments = args)
+    for name in ('a', 'b', 'c'):
+        test.must_exist(test.workpath('build', name + '.pb.cc'))
+    test.up_to_date(arguments = args)
+
+    test.write(['proto', 'a.proto'], proto % id)
+    test.run(arguments = args)
+    test.must_contain_all_lines(test.stdout(), ['a.proto'])
+    if mode in ('file', 'dir'):
+        test.must_not_contain_any_line(test.stdout(), ['c.proto'])
+    if mode == 'file':
+        test.must_not_contain_any_line(test.stdout(), ['b.proto'])
+    test.up_to_date(arguments = args)
+
+test.pass_test()
+
+# Local Variables:
+# tab-width:4
+# indent-tabs-mode:nil
+# End:
+# vim: set expandtab tabstop=4 shiftwidth=4:
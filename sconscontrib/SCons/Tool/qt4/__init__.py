@@ -102,6 +102,8 @@ if SCons.Util.case_sensitive_suffixes('.h', '.H'):
 #cplusplus = __import__('c++', globals(), locals(), [])
 #cxx_suffixes = cplusplus.CXXSuffixes
 cxx_suffixes = [".c", ".cxx", ".cpp", ".cc"]
+# Macros that make a class require a run of moc (Qt4 has no Q_NAMESPACE)
+moc_macros = ["Q_OBJECT", "Q_GADGET"]
 
 def checkMocIncluded(target, source, env):
     moc = target[0]
@@ -131,15 +133,28 @@ class _Automoc:
 
     def __init__(self, objBuilderName):
         self.objBuilderName = objBuilderName
-        # some regular expressions:
-        # Q_OBJECT detection
-        self.qo_search = re.compile(_contents_regex(r'[^A-Za-z0-9]Q_OBJECT[^A-Za-z0-9]'))
-        # cxx and c comment 'eater'
-        self.ccomment = re.compile(_contents_regex(r'/\*(.*?)\*/'),re.S)
-        self.cxxcomment = re.compile(_contents_regex(r'//.*$'),re.M)
-        # we also allow Q_OBJECT in a literal string
-        self.literal_qobject = re.compile(_contents_regex(r'"[^\n]*Q_OBJECT[^\n]*"'))
-        
+        # The automoc lexer: a single pass over the file contents that
+        # reports quoted #include directives and meta-object macros, while
+        # stepping over string literals. With comment gobbling, comments
+        # and character literals get skipped as well.
+        # All alternatives start with a fixed character (the contents get
+        # scanned with a leading newline prepended, such that directives
+        # don't need a '^' anchor), this allows the regex engine to skip
+        # quickly over the uninteresting parts. For the same reason the
+        # check for a preceding identifier character of a macro is done
+        # in scan_contents(), instead of using a lookbehind.
+        directive = r'\n[ \t]*#[ \t]*include[ \t]+"(?P<include>[^"\n]+)"'
+        macro = r'Q_(?P<macro>%s)(?![A-Za-z0-9])' % '|'.join(m[2:] for m in moc_macros)
+        string = r'"(?:[^"\\\n]|\\.)*"'
+        comment = r'/\*.*?\*/|//[^\n]*|\'(?:[^\'\\\n]|\\.)*\''
+        self.moc_lexer = {
+            0 : re.compile(_contents_regex('|'.join([directive, macro, string]))),
+            1 : re.compile(_contents_regex('|'.join([directive, macro, string, comment])),
+                           re.S)
+            }
+        # Tokens whose last occurrence ends the lexing
+        self.moc_tokens = [_contents_regex(m) for m in moc_macros] + [b'include']
+
     def create_automoc_options(self, env):
         """
         Create a dictionary with variables related to Automocing,
@@ -182,8 +197,41 @@ class _Automoc:
         
         return moc_options
 
+    def scan_contents(self, contents, moc_options):
+        """
+        Scans the given file contents and returns the verdict as a
+        tuple (macros, includes), where macros lists the meta-object
+        macros (Q_OBJECT, Q_GADGET) that were found, and
+        includes the names of all files that get #included with
+        double quotes.
+        """
+        lexer = self.moc_lexer[bool(moc_options['gobble_comments'])]
+        contents = b'\n' + contents
+        # Nothing of interest can follow the last macro or include,
+        # so we can stop lexing there
+        last = max(contents.rfind(t) for t in self.moc_tokens)
+        if last < 0:
+            return ((), ())
+        macros = []
+        includes = []
+        for m in lexer.finditer(contents):
+            if m.start() > last:
+                break
+            kind = m.lastgroup
+            if kind == 'macro':
+                c = contents[m.start()-1:m.start()]
+                if c.isalnum() or c == b'_':
+                    # part of a longer identifier
+                    continue
+                macro = 'Q_' + m.group(kind).decode('ascii')
+                if macro not in macros:
+                    macros.append(macro)
+            elif kind == 'include':
+                includes.append(m.group(kind).decode('utf-8', 'replace'))
+        return (tuple(macros), tuple(includes))
+
     def __automoc_strategy_simple(self, env, moc_options, 
-                                  cpp, cpp_contents, out_sources):
+                                  cpp, cpp_verdict, out_sources):
         """
         Default Automoc strategy (Q_OBJECT driven): detect a header file
         (alongside the current cpp/cxx) that contains a Q_OBJECT
@@ -201,15 +249,11 @@ class _Automoc:
             if h:
                 if moc_options['debug']:
                     print("scons: qt4: Scanning '%s' (header of '%s')" % (str(h), str(cpp)))
-                h_contents = h.get_contents()
-                if moc_options['gobble_comments']:
-                    h_contents = self.ccomment.sub(_contents_regex(''), h_contents)
-                    h_contents = self.cxxcomment.sub(_contents_regex(''), h_contents)
-                h_contents = self.literal_qobject.sub(_contents_regex('""'), h_contents)
+                h_verdict = self.scan_contents(h.get_contents(), moc_options)
                 break
         if not h and moc_options['debug']:
             print("scons: qt4: no header for '%s'." % (str(cpp)))
-        if h and self.qo_search.search(h_contents):
+        if h and h_verdict[0]:
             # h file with the Q_OBJECT macro found -> add moc_cpp
             moc_cpp = env.Moc4(h)
             if moc_options['debug']:
@@ -217,8 +261,7 @@ class _Automoc:
             
             # Now, check whether the corresponding CPP file
             # includes the moc'ed output directly...
-            inc_moc_cpp = _contents_regex(r'^\s*#\s*include\s+"%s"' % str(moc_cpp[0]))
-            if cpp and re.search(inc_moc_cpp, cpp_contents, re.M):
+            if cpp and str(moc_cpp[0]) in cpp_verdict[1]:
                 if moc_options['debug']:
                     print("scons: qt4: CXX file '%s' directly includes the moc'ed output '%s', no compiling required" % (str(cpp), str(moc_cpp)))
                 env.Depends(cpp, moc_cpp)
@@ -227,7 +270,7 @@ class _Automoc:
                 if moc_options['debug']:
                     print("scons: qt4: compiling '%s' to '%s'" % (str(cpp), str(moc_o)))
                 out_sources.extend(moc_o)
-        if cpp and self.qo_search.search(cpp_contents):
+        if cpp and cpp_verdict[0]:
             # cpp file with Q_OBJECT macro found -> add moc
             # (to be included in cpp)
             moc = env.Moc4(cpp)
@@ -236,7 +279,7 @@ class _Automoc:
                 print("scons: qt4: found Q_OBJECT macro in '%s', moc'ing to '%s'" % (str(cpp), str(moc)))
 
     def __automoc_strategy_include_driven(self, env, moc_options,
-                                          cpp, cpp_contents, out_sources):
+                                          cpp, cpp_verdict, out_sources):
         """
         Automoc strategy #1 (include driven): searches for "include"
         statements of MOCed files in the current cpp/cxx file.
@@ -251,11 +294,9 @@ class _Automoc:
             cxx_moc = "%s%s%s" % (env.subst('$QT4_XMOCCXXPREFIX'),
                                   self.splitext(cpp.name)[0],
                                   env.subst('$QT4_XMOCCXXSUFFIX'))
-            inc_h_moc = _contents_regex(r'#include\s+"%s"' % h_moc)
-            inc_cxx_moc = _contents_regex(r'#include\s+"%s"' % cxx_moc)
             
             # Search for special includes in qtsolutions style
-            if cpp and re.search(inc_h_moc, cpp_contents):
+            if cpp and h_moc in cpp_verdict[1]:
                 # cpp file with #include directive for a MOCed header found -> add moc
                 
                 # Try to find header file                    
@@ -269,15 +310,11 @@ class _Automoc:
                     if h:
                         if moc_options['debug']:
                             print("scons: qt4: Scanning '%s' (header of '%s')" % (str(h), str(cpp)))
-                        h_contents = h.get_contents()
-                        if moc_options['gobble_comments']:
-                            h_contents = self.ccomment.sub('', h_contents)
-                            h_contents = self.cxxcomment.sub('', h_contents)
-                        h_contents = self.literal_qobject.sub('""', h_contents)
+                        h_verdict = self.scan_contents(h.get_contents(), moc_options)
                         break
                 if not h and moc_options['debug']:
                     print("scons: qt4: no header for '%s'." % (str(cpp)))
-                if h and self.qo_search.search(h_contents):
+                if h and h_verdict[0]:
                     # h file with the Q_OBJECT macro found -> add moc_cpp
                     moc_cpp = env.XMoc4(h)
                     env.Ignore(moc_cpp, moc_cpp)
@@ -293,11 +330,11 @@ class _Automoc:
                         print("scons: qt4: found Q_OBJECT macro in '%s', moc'ing to '%s'" % (str(h), str(h_moc)))
                 else:
                     if moc_options['debug']:
-                        print("scons: qt4: found no Q_OBJECT macro in '%s', but a moc'ed version '%s' gets included in '%s'" % (str(h), inc_h_moc, cpp.name))
+                        print("scons: qt4: found no Q_OBJECT macro in '%s', but a moc'ed version '%s' gets included in '%s'" % (str(h), h_moc, cpp.name))
 
-            if cpp and re.search(inc_cxx_moc, cpp_contents):
+            if cpp and cxx_moc in cpp_verdict[1]:
                 # cpp file with #include directive for a MOCed cxx file found -> add moc
-                if self.qo_search.search(cpp_contents):
+                if cpp_verdict[0]:
                     moc = env.XMoc4(target=cxx_moc, source=cpp)
                     env.Ignore(moc, moc)
                     added = True
@@ -305,12 +342,12 @@ class _Automoc:
                         print("scons: qt4: found Q_OBJECT macro in '%s', moc'ing to '%s'" % (str(cpp), str(moc)))
                 else:
                     if moc_options['debug']:
-                        print("scons: qt4: found no Q_OBJECT macro in '%s', although a moc'ed version '%s' of itself gets included" % (cpp.name, inc_cxx_moc))
+                        print("scons: qt4: found no Q_OBJECT macro in '%s', although a moc'ed version '%s' of itself gets included" % (cpp.name, cxx_moc))
 
             if not added:
                 # Fallback to default Automoc strategy (Q_OBJECT driven)
                self.__automoc_strategy_simple(env, moc_options, cpp,
-                                              cpp_contents, out_sources)
+                                              cpp_verdict, out_sources)
         
     def __call__(self, target, source, env):
         """
@@ -352,21 +389,17 @@ class _Automoc:
                 # c or fortran source
                 continue
             try:
-                cpp_contents = cpp.get_contents()
-                if moc_options['gobble_comments']:
-                    cpp_contents = self.ccomment.sub('', cpp_contents)
-                    cpp_contents = self.cxxcomment.sub('', cpp_contents)
-                cpp_contents = self.literal_qobject.sub('""', cpp_contents)
+                cpp_verdict = self.scan_contents(cpp.get_contents(), moc_options)
             except: continue # may be an still not generated source
             
             if moc_options['auto_scan_strategy'] == 0:
                 # Default Automoc strategy (Q_OBJECT driven)
                 self.__automoc_strategy_simple(env, moc_options,
-                                               cpp, cpp_contents, out_sources)
+                                               cpp, cpp_verdict, out_sources)
             else:
                 # Automoc strategy #1 (include driven)
                 self.__automoc_strategy_include_driven(env, moc_options,
-                                                       cpp, cpp_contents, out_sources)
+                                                       cpp, cpp_verdict, out_sources)
 
         # restore the original env attributes (FIXME)
         self.objBuilder.env = objBuilderEnv
@@ -32,14 +32,25 @@ selection method.
 # WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 #
 
+import atexit
+import concurrent.futures
+import copy
+import csv
+import hashlib
+import json
 import os.path
+import pickle
 import re
 import subprocess
+import time
+import xml.parsers.expat
+import zlib
 
 import SCons.Action
 import SCons.Builder
 import SCons.Defaults
 import SCons.Scanner
+import SCons.Subst
 import SCons.Tool
 import SCons.Util
 
@@ -102,20 +113,98 @@ if SCons.Util.case_sensitive_suffixes('.h', '.H'):
 #cplusplus = __import__('c++', globals(), locals(), [])
 #cxx_suffixes = cplusplus.CXXSuffixes
 cxx_suffixes = [".c", ".cxx", ".cpp", ".cc"]
+# Macros that make a class (or namespace) require a run of moc
+moc_macros = ["Q_OBJECT", "Q_GADGET", "Q_NAMESPACE"]
+
+# The quoted #includes of the cxx files scanned by the Automoc,
+# for checkMocIncluded
+_scanned_includes = {}
 
 def checkMocIncluded(target, source, env):
     moc = target[0]
     cpp = source[0]
-    # looks like cpp.includes is cleared before the build stage :-(
-    # not really sure about the path transformations (moc.cwd? cpp.cwd?) :-/
-    path = SCons.Defaults.CScan.path_function(env, moc.cwd)
-    includes = SCons.Defaults.CScan(cpp, env, path)
-    if not moc in includes:
+    includes = None
+    if _moc_depfile_enabled(env):
+        includes = _scanned_includes.get(cpp)
+    if includes is not None:
+        # the Automoc has seen the #includes already, no need to
+        # run the C scanner over the file again
+        included = moc.name in [i.replace('\\', '/').split('/')[-1] for i in includes]
+    else:
+        # looks like cpp.includes is cleared before the build stage :-(
+        # not really sure about the path transformations (moc.cwd? cpp.cwd?) :-/
+        path = SCons.Defaults.CScan.path_function(env, moc.cwd)
+        included = moc in SCons.Defaults.CScan(cpp, env, path)
+    if not included:
         SCons.Warnings.warn(
             GeneratedMocFileNotIncluded,
             "Generated moc file '%s' is not included by '%s'" %
             (str(moc), str(cpp)))
 
+#
+# Dependency files of moc (QT5_MOC_DEPFILE)
+#
+def _moc_depfile_enabled(env):
+    try:
+        return int(env.subst('$QT5_MOC_DEPFILE')) != 0
+    except ValueError:
+        return False
+
+_depfile_rule_re = re.compile(r':(?:\s|$)')
+_depfile_split_re = re.compile(r'(?<!\\)\s+')
+
+def _parse_depfile(text):
+    """
+    Returns the list of prerequisites in a Makefile style dependency
+    file, as written by 'moc --output-dep-file'.
+    """
+    text = text.replace('\\\r\n', ' ').replace('\\\n', ' ')
+    deps = []
+    for line in text.splitlines():
+        # the rule's target may contain a drive letter, like 'C:/...'
+        m = _depfile_rule_re.search(line)
+        if not m:
+            continue
+        for dep in _depfile_split_re.split(line[m.end():].strip()):
+            if dep:
+                deps.append(dep.replace('\\ ', ' ').replace('\\#', '#').replace('$$', '$'))
+    return deps
+
+_moc_deps = {}
+
+def _moc_depfile_deps(env, depfile):
+    """
+    Returns the dependencies listed in the given moc depfile as a tuple
+    of absolute paths, or None if there is no such file. Parse results
+    are remembered by the mtime and size of the depfile, also in the
+    QT5_CACHEFILE if one is set, such that unchanged depfiles don't
+    have to be read again.
+    """
+    try:
+        st = os.stat(depfile)
+    except OSError:
+        return None
+    stamp = (st.st_mtime, st.st_size)
+    cache = _get_cache(env)
+    entry = _moc_deps.get(depfile)
+    if entry is None and cache is not None:
+        entry = cache.get('mocdeps', depfile)
+    if entry is not None and entry[0] == stamp:
+        return entry[1]
+    try:
+        with open(depfile, 'r') as f:
+            text = f.read()
+    except (IOError, OSError):
+        return None
+    top = env.Dir('#').get_abspath()
+    deps = tuple(os.path.normpath(os.path.join(top, d))
+                 for d in _parse_depfile(text))
+    entry = (stamp, deps)
+    _moc_deps[depfile] = entry
+    if cache is not None:
+        cache.put('mocdeps', depfile, entry)
+    return deps
+
 def find_file(filename, paths, node_factory):
     for dir in paths:
         node = node_factory(filename, dir)
@@ -123,6 +212,270 @@ def find_file(filename, paths, node_factory):
             return node
     return None
 
+_dir_entries_cache = {}
+
+def _dir_entries(dir):
+    """
+    Returns the set of (normcased) names in the given Dir node, its
+    repository directories and its source directories (VariantDir).
+    The directories get listed only once per SCons run.
+    """
+    try:
+        return _dir_entries_cache[dir]
+    except KeyError:
+        pass
+    entries = set()
+    dirs = dir.get_all_rdirs()
+    for srcdir in dir.srcdir_list():
+        dirs.extend(srcdir.get_all_rdirs())
+    for d in dirs:
+        try:
+            entries.update(os.path.normcase(e) for e in os.listdir(d.get_abspath()))
+        except OSError:
+            pass
+    _dir_entries_cache[dir] = entries
+    return entries
+
+class _SearchPathIndex:
+    """
+    An index of the names in a list of directories, such that
+    find() gives the same result as find_file() for this path, but
+    doesn't have to create (and stat) a node for every directory.
+    """
+
+    def __init__(self, dirs):
+        self.dirs = {}
+        for dir in dirs:
+            for name in _dir_entries(dir):
+                self.dirs.setdefault(name, []).append(dir)
+
+    def find(self, filename, node_factory):
+        for dir in self.dirs.get(os.path.normcase(filename), ()):
+            node = node_factory(filename, dir)
+            if node.rexists():
+                return node
+        return None
+
+#
+# Persistent cache
+#
+class _Qt5Cache:
+    """
+    A dictionary of named sections that gets pickled to the file given
+    by QT5_CACHEFILE, such that the results of expensive scans survive
+    from one SCons run to the next. Every entry remembers the last
+    "generation" (number of saves) in which it was used, entries that
+    weren't used for a while get dropped on the next save.
+    Only builtin types get stored, since the pickle has to be loadable
+    independent of the module name under which SCons imported this tool.
+    """
+
+    version = 1
+    keep_generations = 20
+
+    def __init__(self, path):
+        self.path = path
+        self.dirty = False
+        self.generation = 0
+        self.sections = {}
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+            if data['version'] == self.version:
+                self.generation = data['generation'] + 1
+                self.sections = data['sections']
+        except Exception:
+            # no cache yet, or an unreadable one...start from scratch
+            pass
+
+    def get(self, section, key):
+        try:
+            entry = self.sections[section][key]
+        except KeyError:
+            return None
+        if entry[0] != self.generation:
+            self.sections[section][key] = (self.generation, entry[1])
+        return entry[1]
+
+    def put(self, section, key, value):
+        self.sections.setdefault(section, {})[key] = (self.generation, value)
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        oldest = self.generation - self.keep_generations
+        for section in self.sections.values():
+            for key in [k for k, e in section.items() if e[0] < oldest]:
+                del section[key]
+        tmp = self.path + '.tmp'
+        try:
+            d = os.path.dirname(self.path)
+            if d and not os.path.isdir(d):
+                os.makedirs(d)
+            with open(tmp, 'wb') as f:
+                pickle.dump({'version' : self.version,
+                             'generation' : self.generation,
+                             'sections' : self.sections},
+                            f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path)
+            self.dirty = False
+        except (OSError, pickle.PickleError):
+            pass
+
+_qt5_caches = {}
+
+def _get_cache(env):
+    """
+    Return the _Qt5Cache for the QT5_CACHEFILE of env (or of the
+    OS environment), or None.
+    """
+    path = env.subst('$QT5_CACHEFILE') or os.environ.get('QT5_CACHEFILE', '')
+    if not path:
+        return None
+    path = env.File(path).get_abspath()
+    try:
+        return _qt5_caches[path]
+    except KeyError:
+        cache = _Qt5Cache(path)
+        _qt5_caches[path] = cache
+        return cache
+
+#
+# Toolchain detection results, remembered per process and in the
+# QT5_CACHEFILE. Every entry is a tuple (path, mtime, value), and only
+# valid for as long as the executable at path has the given mtime.
+#
+_toolchain_memo = {}
+# Optional commands that couldn't be found, remembered per process only,
+# such that a later install gets picked up by the next run
+_toolchain_missing = set()
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except (OSError, TypeError):
+        return None
+
+def _toolchain_lookup(env, section, key):
+    """Returns the remembered value for key, or None if it's outdated."""
+    entry = _toolchain_memo.get((section, key))
+    if entry is None:
+        cache = _get_cache(env)
+        if cache is not None:
+            entry = cache.get(section, key)
+    if entry is None or entry[1] is None or _mtime(entry[0]) != entry[1]:
+        return None
+    _toolchain_memo[(section, key)] = entry
+    return entry[2]
+
+def _toolchain_store(env, section, key, path, value):
+    entry = (path, _mtime(path), value)
+    _toolchain_memo[(section, key)] = entry
+    cache = _get_cache(env)
+    if cache is not None:
+        cache.put(section, key, entry)
+
+def _save_caches():
+    for cache in _qt5_caches.values():
+        cache.save()
+
+atexit.register(_save_caches)
+
+#
+# Automoc instrumentation
+#
+class _AutomocReport:
+    """
+    Counters and timings of the Automoc emitter, one record per cxx
+    file, that get written to the file given by QT5_AUTOMOC_REPORT
+    when SCons exits. For a name ending in '.csv' that's a table with
+    one row per cxx file, else a JSON document that also sums up the
+    records per directory, slowest first.
+    A record counts the bytes that were read and scanned for the cxx
+    file and its header, the time spent in the lexer, the verdicts that
+    came from the QT5_CACHEFILE, the header names that were probed,
+    the moc nodes that got created and the total time of the strategy.
+    """
+
+    counters = ('bytes', 'scanned', 'cached', 'scan_time',
+                'probes', 'mocs', 'time')
+
+    def __init__(self, path):
+        self.path = path
+        self.records = []
+
+    def record(self, cpp, target):
+        """Returns a new record for the given cxx file."""
+        record = dict.fromkeys(self.counters, 0)
+        record['source'] = str(cpp)
+        record['dir'] = str(cpp.get_dir())
+        record['target'] = str(target[0])
+        self.records.append(record)
+        return record
+
+    def directories(self):
+        dirs = {}
+        for record in self.records:
+            d = dirs.get(record['dir'])
+            if d is None:
+                d = dict.fromkeys(self.counters, 0)
+                d['dir'] = record['dir']
+                d['sources'] = 0
+                dirs[record['dir']] = d
+            d['sources'] += 1
+            for c in self.counters:
+                d[c] += record[c]
+        return sorted(dirs.values(), key=lambda d: (-d['time'], d['dir']))
+
+    def save(self):
+        if not self.records:
+            return
+        try:
+            d = os.path.dirname(self.path)
+            if d and not os.path.isdir(d):
+                os.makedirs(d)
+            if self.path.lower().endswith('.csv'):
+                fields = ('source', 'dir', 'target') + self.counters
+                with open(self.path, 'w', newline='') as f:
+                    writer = csv.DictWriter(f, fields)
+                    writer.writeheader()
+                    writer.writerows(self.records)
+            else:
+                with open(self.path, 'w') as f:
+                    json.dump({'sources' : self.records,
+                               'directories' : self.directories()},
+                              f, indent=1, sort_keys=True)
+        except (OSError, IOError):
+            pass
+
+_automoc_reports = {}
+
+def _get_automoc_report(env):
+    """
+    Return the _AutomocReport for the QT5_AUTOMOC_REPORT of env, or None.
+    """
+    path = env.subst('$QT5_AUTOMOC_REPORT')
+    if not path:
+        return None
+    path = env.File(path).get_abspath()
+    try:
+        return _automoc_reports[path]
+    except KeyError:
+        report = _AutomocReport(path)
+        _automoc_reports[path] = report
+        return report
+
+def _save_automoc_reports():
+    for report in _automoc_reports.values():
+        report.save()
+
+atexit.register(_save_automoc_reports)
+
+# Bump this whenever the format of the automoc scan verdicts changes,
+# such that old entries in the QT5_CACHEFILE get ignored
+_AUTOMOC_SCAN_VERSION = 2
+
 class _Automoc:
     """
     Callable class, which works as an emitter for Programs, SharedLibraries and
@@ -131,15 +484,45 @@ class _Automoc:
 
     def __init__(self, objBuilderName):
         self.objBuilderName = objBuilderName
-        # some regular expressions:
-        # Q_OBJECT detection
-        self.qo_search = re.compile(_contents_regex(r'[^A-Za-z0-9]Q_OBJECT[^A-Za-z0-9]'))
-        # cxx and c comment 'eater'
-        self.ccomment = re.compile(_contents_regex(r'/\*(.*?)\*/'),re.S)
-        self.cxxcomment = re.compile(_contents_regex(r'//.*$'),re.M)
-        # we also allow Q_OBJECT in a literal string
-        self.literal_qobject = re.compile(_contents_regex(r'"[^\n]*Q_OBJECT[^\n]*"'))
-        
+        # scan verdicts of the current emitter call, see prefetch()
+        self.prefetched = {}
+        # (cached, bytes, scan time) of the prefetched verdicts
+        self.prefetched_stats = {}
+        # QT5_AUTOMOC_REPORT record of the current cxx file, see note()
+        self.record = None
+        # the current target and its precompiled Qt headers, see moc_object()
+        self.target = None
+        self.pch = None
+        # moc'ed sources for the mocs_compilation files, see compile_unity()
+        self.unity_mocs = []
+        # header search paths, see search_path_index()
+        self.search_path_indexes = {}
+        # out_sources that got included by a cxx file, see remove_source()
+        self.source_index = {}
+        self.indexed_sources = 0
+        self.removed_sources = set()
+        # The automoc lexer: a single pass over the file contents that
+        # reports quoted #include directives and meta-object macros, while
+        # stepping over string literals. With comment gobbling, comments
+        # and character literals get skipped as well.
+        # All alternatives start with a fixed character (the contents get
+        # scanned with a leading newline prepended, such that directives
+        # don't need a '^' anchor), this allows the regex engine to skip
+        # quickly over the uninteresting parts. For the same reason the
+        # check for a preceding identifier character of a macro is done
+        # in scan_contents(), instead of using a lookbehind.
+        directive = r'\n[ \t]*#[ \t]*include[ \t]+"(?P<include>[^"\n]+)"'
+        macro = r'Q_(?P<macro>%s)(?![A-Za-z0-9])' % '|'.join(m[2:] for m in moc_macros)
+        string = r'"(?:[^"\\\n]|\\.)*"'
+        comment = r'/\*.*?\*/|//[^\n]*|\'(?:[^\'\\\n]|\\.)*\''
+        self.moc_lexer = {
+            0 : re.compile(_contents_regex('|'.join([directive, macro, string]))),
+            1 : re.compile(_contents_regex('|'.join([directive, macro, string, comment])),
+                           re.S)
+            }
+        # Tokens whose last occurrence ends the lexing
+        self.moc_tokens = [_contents_regex(m) for m in moc_macros] + [b'include']
+
     def create_automoc_options(self, env):
         """
         Create a dictionary with variables related to Automocing,
@@ -151,7 +534,12 @@ class _Automoc:
                        'gobble_comments' : 0,
                        'debug' : 0,
                        'auto_cpppath' : True,
-                       'cpppaths' : []}
+                       'cpppaths' : [],
+                       'jobs' : 1,
+                       'unity' : 0,
+                       'pch' : 0,
+                       'cache' : _get_cache(env),
+                       'report' : _get_automoc_report(env)}
         try:
             if int(env.subst('$QT5_AUTOSCAN')) == 0:
                 moc_options['auto_scan'] = False
@@ -169,6 +557,22 @@ class _Automoc:
             moc_options['debug'] = int(env.subst('$QT5_DEBUG'))
         except ValueError:
             pass
+        try:
+            moc_options['jobs'] = int(env.subst('$QT5_AUTOSCAN_JOBS'))
+        except ValueError:
+            pass
+        try:
+            moc_options['unity'] = int(env.subst('$QT5_AUTOMOC_UNITY'))
+        except ValueError:
+            pass
+        try:
+            moc_options['pch'] = int(env.subst('$QT5_MOC_PCH'))
+        except ValueError:
+            pass
+        if moc_options['pch'] and 'PCH' in env['BUILDERS']:
+            # MSVC, where SCons' own PCH/PCHSTOP variables apply
+            # to the moc'ed files as well
+            moc_options['pch'] = 0
         try:
             if int(env.subst('$QT5_AUTOMOC_SCANCPPPATH')) == 0:
                 moc_options['auto_cpppath'] = False
@@ -182,8 +586,299 @@ class _Automoc:
         
         return moc_options
 
+    def scan_contents(self, contents, moc_options):
+        """
+        Scans the given file contents and returns the verdict as a
+        tuple (macros, includes), where macros lists the meta-object
+        macros (Q_OBJECT, Q_GADGET, Q_NAMESPACE) that were found, and
+        includes the names of all files that get #included with
+        double quotes.
+        """
+        lexer = self.moc_lexer[bool(moc_options['gobble_comments'])]
+        contents = b'\n' + contents
+        # Nothing of interest can follow the last macro or include,
+        # so we can stop lexing there
+        last = max(contents.rfind(t) for t in self.moc_tokens)
+        if last < 0:
+            return ((), ())
+        macros = []
+        includes = []
+        for m in lexer.finditer(contents):
+            if m.start() > last:
+                break
+            kind = m.lastgroup
+            if kind == 'macro':
+                c = contents[m.start()-1:m.start()]
+                if c.isalnum() or c == b'_':
+                    # part of a longer identifier
+                    continue
+                macro = 'Q_' + m.group(kind).decode('ascii')
+                if macro not in macros:
+                    macros.append(macro)
+            elif kind == 'include':
+                includes.append(m.group(kind).decode('utf-8', 'replace'))
+        return (tuple(macros), tuple(includes))
+
+    def scan_key(self, node, moc_options):
+        """
+        Returns the key of the given file in the QT5_CACHEFILE, or None
+        if no cache is used or the file can't be cached.
+        The csig is what the Decider asks for later anyway, so it doesn't
+        cost an extra read.
+        """
+        if moc_options['cache'] is None or node.is_derived() or not node.rexists():
+            return None
+        return (_AUTOMOC_SCAN_VERSION, node.get_csig(),
+                moc_options['gobble_comments'])
+
+    def scan(self, node, moc_options):
+        """
+        Returns the scan verdict (see scan_contents) for the given
+        cxx or header file. With a QT5_CACHEFILE, verdicts get looked up
+        by the content signature of the file first, such that unchanged
+        files aren't read and scanned again.
+        """
+        try:
+            verdict = self.prefetched[node]
+        except KeyError:
+            pass
+        else:
+            if self.record is not None:
+                cached, size, elapsed = self.prefetched_stats[node]
+                self.note(cached=cached, scanned=1-cached,
+                          bytes=size, scan_time=elapsed)
+            return verdict
+        cache = moc_options['cache']
+        key = self.scan_key(node, moc_options)
+        verdict = None
+        if key is not None:
+            verdict = cache.get('automoc', key)
+        if verdict is None:
+            contents = node.get_contents()
+            start = time.perf_counter()
+            verdict = self.scan_contents(contents, moc_options)
+            self.note(scanned=1, bytes=len(contents),
+                      scan_time=time.perf_counter() - start)
+            if key is not None:
+                cache.put('automoc', key, verdict)
+        else:
+            self.note(cached=1)
+        _scanned_includes[node] = verdict[1]
+        return verdict
+
+    def scan_file(self, path, moc_options):
+        """
+        Reads and scans the file with the given path, this is what
+        the worker threads of prefetch() do. Returns the verdict, the
+        size of the file and the time it took to scan it.
+        """
+        with open(path, 'rb') as f:
+            contents = f.read()
+        start = time.perf_counter()
+        verdict = self.scan_contents(contents, moc_options)
+        return (verdict, len(contents), time.perf_counter() - start)
+
+    def prefetch(self, env, moc_options, cpps):
+        """
+        Scans the given cxx files and their headers concurrently, with
+        QT5_AUTOSCAN_JOBS worker threads. The verdicts get stored in
+        self.prefetched, where scan() picks them up when the strategies
+        run afterwards.
+        All the work on nodes (finding the headers, computing csigs for
+        the cache) happens in the calling thread, since the SCons node
+        layer isn't thread-safe. The workers only read and scan files.
+        """
+        cache = moc_options['cache']
+        jobs = []
+        seen = set()
+        for cpp in cpps:
+            nodes = [cpp]
+            h = self.find_header(env, moc_options, cpp)
+            if h:
+                nodes.append(h)
+            for node in nodes:
+                if node in seen or node.is_derived() or not node.rexists():
+                    # generated sources are left to scan(), they may
+                    # not exist yet
+                    continue
+                seen.add(node)
+                key = self.scan_key(node, moc_options)
+                if key is not None:
+                    verdict = cache.get('automoc', key)
+                    if verdict is not None:
+                        self.prefetched[node] = verdict
+                        self.prefetched_stats[node] = (1, 0, 0.0)
+                        _scanned_includes[node] = verdict[1]
+                        continue
+                jobs.append((node, key, node.rfile().get_abspath()))
+        if not jobs:
+            return
+        with concurrent.futures.ThreadPoolExecutor(moc_options['jobs']) as pool:
+            futures = [pool.submit(self.scan_file, path, moc_options)
+                       for node, key, path in jobs]
+            for (node, key, path), future in zip(jobs, futures):
+                try:
+                    verdict, size, elapsed = future.result()
+                except (IOError, OSError):
+                    # leave it to scan()
+                    continue
+                self.prefetched[node] = verdict
+                self.prefetched_stats[node] = (0, size, elapsed)
+                _scanned_includes[node] = verdict[1]
+                if key is not None:
+                    cache.put('automoc', key, verdict)
+
+    def find_header(self, env, moc_options, cpp):
+        """
+        Returns the header that belongs to the given cxx file, searched
+        in the directory of the cxx file and the automoc CPPPATH, or None.
+        """
+        cpp_dir = cpp.get_dir()
+        cpp_entries = _dir_entries(cpp_dir)
+        index = moc_options.get('search_path_index')
+        if index is None:
+            index = self.search_path_index(env, moc_options)
+            moc_options['search_path_index'] = index
+        for h_ext in header_extensions:
+            self.note(probes=1)
+            hname = self.splitext(cpp.name)[0] + h_ext
+            if os.path.normcase(hname) in cpp_entries:
+                h = env.File(hname, cpp_dir)
+                if h.rexists():
+                    return h
+            h = index.find(hname, env.File)
+            if h:
+                return h
+        return None
+
+    def search_path_index(self, env, moc_options):
+        """
+        Returns the _SearchPathIndex for the automoc CPPPATH of the
+        given options. Indexes get reused for as long as the list of
+        directories stays the same.
+        """
+        dirs = tuple(env.Dir(p) for p in moc_options['cpppaths'])
+        try:
+            return self.search_path_indexes[dirs]
+        except KeyError:
+            index = _SearchPathIndex(dirs)
+            self.search_path_indexes[dirs] = index
+            return index
+
+    def compile_unity(self, env, moc_options, target, mocs):
+        """
+        Distributes the given moc'ed sources over QT5_AUTOMOC_UNITY
+        aggregate files '<target>_mocs_compilation_<k>', that simply
+        #include them, and returns the objects of these aggregates.
+        A moc file always lands in the same aggregate, given by a hash
+        of its path, such that adding or removing a header changes only
+        the one aggregate it belongs to.
+        """
+        tdir = target[0].get_dir()
+        stem = self.splitext(target[0].name)[0]
+        chunks = {}
+        for moc in mocs:
+            try:
+                inc = os.path.relpath(moc.get_abspath(), tdir.get_abspath())
+            except ValueError:
+                # different drives on Windows
+                inc = moc.get_abspath()
+            inc = inc.replace(os.sep, '/')
+            k = zlib.crc32(inc.encode('utf-8')) % moc_options['unity']
+            chunks.setdefault(k, {})[inc] = moc
+        objs = []
+        for k in sorted(chunks):
+            incs = sorted(chunks[k])
+            text = ''.join('#include "%s"\n' % inc for inc in incs)
+            unity = env.MocUnity5(tdir.File('%s_mocs_compilation_%d%s' %
+                                            (stem, k, env.subst('$CXXFILESUFFIX'))),
+                                  env.Value(text))
+            unity_o = self.moc_object(env, moc_options, unity)
+            # the moc'ed files have to exist, before the aggregate
+            # can get compiled
+            env.Depends(unity_o, [chunks[k][inc] for inc in incs])
+            if moc_options['debug']:
+                print("scons: qt5: compiling %d moc'ed files as '%s'" % (len(incs), str(unity[0])))
+            objs.extend(unity_o)
+        return objs
+
+    def moc_object(self, env, moc_options, moc_cpp):
+        """
+        Returns the object for the given moc'ed source. With QT5_MOC_PCH
+        it gets compiled with the precompiled Qt headers of the target,
+        which are created on first use.
+        """
+        if not moc_options['pch']:
+            return self.objBuilder(moc_cpp)
+        if self.pch is None:
+            self.pch = self.precompiled_header(env, moc_options, self.target)
+        header, gch = self.pch
+        flags = SCons.Util.CLVar(env.get('CCFLAGS', [])) + ['-include', header]
+        moc_o = self.objBuilder(moc_cpp, CCFLAGS=flags)
+        env.Depends(moc_o, gch)
+        return moc_o
+
+    def precompiled_header(self, env, moc_options, target):
+        """
+        Returns the header 'qt5_pch_<hash>.h' (or 'qt5_shpch_<hash>.h' for
+        shared objects), that #includes the QT5_MOCPCHHEADERS, and its
+        precompiled version. The header is named after a hash of its
+        contents and of the command that precompiles it, and gets created
+        next to the first target that needs it. All targets with the same
+        headers and flags share it, such that a moc'ed file that is part of
+        several targets gets compiled with the same flags for each of them.
+        """
+        shared = self.objBuilderName == 'SharedObject'
+        headers = env.Flatten(env.get('QT5_MOCPCHHEADERS', []))
+        text = ''.join('#include <%s>\n' % env.subst(h) for h in headers)
+        if shared:
+            com = env.subst('$QT5_MOCSHPCHCOM', SCons.Subst.SUBST_SIG)
+        else:
+            com = env.subst('$QT5_MOCPCHCOM', SCons.Subst.SUBST_SIG)
+        digest = hashlib.sha256((text + '\0' + com).encode('utf-8')).hexdigest()[:16]
+        key = (shared, digest)
+        try:
+            return _moc_pch_nodes[key]
+        except KeyError:
+            pass
+        if shared:
+            name = 'qt5_shpch_%s.h' % digest
+        else:
+            name = 'qt5_pch_%s.h' % digest
+        header = env.MocUnity5(target[0].get_dir().File(name), env.Value(text))[0]
+        gch = _moc_precompile(env, header, shared)
+        if moc_options['debug']:
+            print("scons: qt5: precompiling '%s' for the moc'ed files of '%s'" % (str(header), str(target[0])))
+        _moc_pch_nodes[key] = (header, gch)
+        return (header, gch)
+
+    def note(self, **counters):
+        """
+        Adds the given values to the counters of the current
+        QT5_AUTOMOC_REPORT record, if there is one.
+        """
+        if self.record is not None:
+            for c, value in counters.items():
+                self.record[c] += value
+
+    def remove_source(self, out_sources, name):
+        """
+        Marks the first entry of out_sources, whose first source has the
+        given name, as removed. The entries get indexed by these names
+        once, and the ones that were added since the last call are
+        indexed on the fly, such that every removal takes constant time.
+        """
+        for idx in range(self.indexed_sources, len(out_sources)):
+            s = out_sources[idx]
+            if hasattr(s, "sources") and len(s.sources) > 0:
+                self.source_index.setdefault(str(s.sources[0]), []).append(idx)
+        self.indexed_sources = len(out_sources)
+        candidates = self.source_index.get(name)
+        if candidates:
+            self.removed_sources.add(candidates.pop(0))
+
     def __automoc_strategy_simple(self, env, moc_options, 
-                                  cpp, cpp_contents, out_sources):
+                                  cpp, cpp_verdict, out_sources):
         """
         Default Automoc strategy (Q_OBJECT driven): detect a header file
         (alongside the current cpp/cxx) that contains a Q_OBJECT
@@ -192,51 +887,47 @@ class _Automoc:
         it gets MOCed too.
         """
         
-        h=None
-        for h_ext in header_extensions:
-            # try to find the header file in the corresponding source
-            # directory
-            hname = self.splitext(cpp.name)[0] + h_ext
-            h = find_file(hname, [cpp.get_dir()]+moc_options['cpppaths'], env.File)
-            if h:
-                if moc_options['debug']:
-                    print("scons: qt5: Scanning '%s' (header of '%s')" % (str(h), str(cpp)))
-                h_contents = h.get_contents()
-                if moc_options['gobble_comments']:
-                    h_contents = self.ccomment.sub(_contents_regex(''), h_contents)
-                    h_contents = self.cxxcomment.sub(_contents_regex(''), h_contents)
-                h_contents = self.literal_qobject.sub(_contents_regex('""'), h_contents)
-                break
+        # try to find the header file in the corresponding source
+        # directory
+        h = self.find_header(env, moc_options, cpp)
+        if h:
+            if moc_options['debug']:
+                print("scons: qt5: Scanning '%s' (header of '%s')" % (str(h), str(cpp)))
+            h_verdict = self.scan(h, moc_options)
         if not h and moc_options['debug']:
             print("scons: qt5: no header for '%s'." % (str(cpp)))
-        if h and self.qo_search.search(h_contents):
+        if h and h_verdict[0]:
             # h file with the Q_OBJECT macro found -> add moc_cpp
             moc_cpp = env.Moc5(h)
+            self.note(mocs=len(moc_cpp))
             if moc_options['debug']:
                 print("scons: qt5: found Q_OBJECT macro in '%s', moc'ing to '%s'" % (str(h), str(moc_cpp)))
             
             # Now, check whether the corresponding CPP file
             # includes the moc'ed output directly...
-            inc_moc_cpp = _contents_regex(r'^\s*#\s*include\s+"%s"' % str(moc_cpp[0]))
-            if cpp and re.search(inc_moc_cpp, cpp_contents, re.M):
+            if cpp and str(moc_cpp[0]) in cpp_verdict[1]:
                 if moc_options['debug']:
                     print("scons: qt5: CXX file '%s' directly includes the moc'ed output '%s', no compiling required" % (str(cpp), str(moc_cpp)))
                 env.Depends(cpp, moc_cpp)
+            elif moc_options['unity']:
+                # gets compiled as part of a mocs_compilation file
+                self.unity_mocs.extend(moc_cpp)
             else:
-                moc_o = self.objBuilder(moc_cpp)
+                moc_o = self.moc_object(env, moc_options, moc_cpp)
                 if moc_options['debug']:
                     print("scons: qt5: compiling '%s' to '%s'" % (str(cpp), str(moc_o)))
                 out_sources.extend(moc_o)
-        if cpp and self.qo_search.search(cpp_contents):
+        if cpp and cpp_verdict[0]:
             # cpp file with Q_OBJECT macro found -> add moc
             # (to be included in cpp)
             moc = env.Moc5(cpp)
             env.Ignore(moc, moc)
+            self.note(mocs=len(moc))
             if moc_options['debug']:
                 print("scons: qt5: found Q_OBJECT macro in '%s', moc'ing to '%s'" % (str(cpp), str(moc)))
 
     def __automoc_strategy_include_driven(self, env, moc_options,
-                                          cpp, cpp_contents, out_sources):
+                                          cpp, cpp_verdict, out_sources):
         """
         Automoc strategy #1 (include driven): searches for "include"
         statements of MOCed files in the current cpp/cxx file.
@@ -251,66 +942,52 @@ class _Automoc:
             cxx_moc = "%s%s%s" % (env.subst('$QT5_XMOCCXXPREFIX'),
                                   self.splitext(cpp.name)[0],
                                   env.subst('$QT5_XMOCCXXSUFFIX'))
-            inc_h_moc = _contents_regex(r'#include\s+"%s"' % h_moc)
-            inc_cxx_moc = _contents_regex(r'#include\s+"%s"' % cxx_moc)
             
             # Search for special includes in qtsolutions style
-            if cpp and re.search(inc_h_moc, cpp_contents):
+            if cpp and h_moc in cpp_verdict[1]:
                 # cpp file with #include directive for a MOCed header found -> add moc
                 
-                # Try to find header file                    
-                h=None
-                hname=""
-                for h_ext in header_extensions:
-                    # Try to find the header file in the
-                    # corresponding source directory
-                    hname = self.splitext(cpp.name)[0] + h_ext
-                    h = find_file(hname, [cpp.get_dir()]+moc_options['cpppaths'], env.File)
-                    if h:
-                        if moc_options['debug']:
-                            print("scons: qt5: Scanning '%s' (header of '%s')" % (str(h), str(cpp)))
-                        h_contents = h.get_contents()
-                        if moc_options['gobble_comments']:
-                            h_contents = self.ccomment.sub('', h_contents)
-                            h_contents = self.cxxcomment.sub('', h_contents)
-                        h_contents = self.literal_qobject.sub('""', h_contents)
-                        break
+                # Try to find the header file in the
+                # corresponding source directory
+                h = self.find_header(env, moc_options, cpp)
+                if h:
+                    if moc_options['debug']:
+                        print("scons: qt5: Scanning '%s' (header of '%s')" % (str(h), str(cpp)))
+                    h_verdict = self.scan(h, moc_options)
                 if not h and moc_options['debug']:
                     print("scons: qt5: no header for '%s'." % (str(cpp)))
-                if h and self.qo_search.search(h_contents):
+                if h and h_verdict[0]:
                     # h file with the Q_OBJECT macro found -> add moc_cpp
                     moc_cpp = env.XMoc5(h)
                     env.Ignore(moc_cpp, moc_cpp)
+                    self.note(mocs=len(moc_cpp))
                     added = True
                     # Removing file from list of sources, because it is not to be
                     # compiled but simply included by the cpp/cxx file.
-                    for idx, s in enumerate(out_sources):
-                        if hasattr(s, "sources") and len(s.sources) > 0:
-                            if str(s.sources[0]) == h_moc:
-                                out_sources.pop(idx)
-                                break
+                    self.remove_source(out_sources, h_moc)
                     if moc_options['debug']:
                         print("scons: qt5: found Q_OBJECT macro in '%s', moc'ing to '%s'" % (str(h), str(h_moc)))
                 else:
                     if moc_options['debug']:
-                        print("scons: qt5: found no Q_OBJECT macro in '%s', but a moc'ed version '%s' gets included in '%s'" % (str(h), inc_h_moc, cpp.name))
+                        print("scons: qt5: found no Q_OBJECT macro in '%s', but a moc'ed version '%s' gets included in '%s'" % (str(h), h_moc, cpp.name))
 
-            if cpp and re.search(inc_cxx_moc, cpp_contents):
+            if cpp and cxx_moc in cpp_verdict[1]:
                 # cpp file with #include directive for a MOCed cxx file found -> add moc
-                if self.qo_search.search(cpp_contents):
+                if cpp_verdict[0]:
                     moc = env.XMoc5(target=cxx_moc, source=cpp)
                     env.Ignore(moc, moc)
+                    self.note(mocs=len(moc))
                     added = True
                     if moc_options['debug']:
                         print("scons: qt5: found Q_OBJECT macro in '%s', moc'ing to '%s'" % (str(cpp), str(moc)))
                 else:
                     if moc_options['debug']:
-                        print("scons: qt5: found no Q_OBJECT macro in '%s', although a moc'ed version '%s' of itself gets included" % (cpp.name, inc_cxx_moc))
+                        print("scons: qt5: found no Q_OBJECT macro in '%s', although a moc'ed version '%s' of itself gets included" % (cpp.name, cxx_moc))
 
             if not added:
                 # Fallback to default Automoc strategy (Q_OBJECT driven)
                self.__automoc_strategy_simple(env, moc_options, cpp,
-                                              cpp_contents, out_sources)
+                                              cpp_verdict, out_sources)
         
     def __call__(self, target, source, env):
         """
@@ -322,6 +999,8 @@ class _Automoc:
         # some shortcuts used in the scanner
         self.splitext = SCons.Util.splitext
         self.objBuilder = getattr(env, self.objBuilderName)
+        self.target = target
+        self.pch = None
 
         # The following is kind of hacky to get builders working properly (FIXME)
         objBuilderEnv = self.objBuilder.env
@@ -334,6 +1013,7 @@ class _Automoc:
         # make a deep copy for the result; MocH objects will be appended
         out_sources = source[:]
 
+        cpps = []
         for obj in source:
             if not moc_options['auto_scan']:
                 break
@@ -351,34 +1031,75 @@ class _Automoc:
                     print("scons: qt5: '%s' is no cxx file. Discarded." % str(cpp)) 
                 # c or fortran source
                 continue
+            cpps.append(cpp)
+
+        self.prefetched = {}
+        self.prefetched_stats = {}
+        self.unity_mocs = []
+        self.source_index = {}
+        self.indexed_sources = 0
+        self.removed_sources = set()
+        if moc_options['jobs'] > 1 and len(cpps) > 1:
+            # read and scan the files in parallel, the strategies below
+            # then run in the original order
+            self.prefetch(env, moc_options, cpps)
+
+        report = moc_options['report']
+        for cpp in cpps:
+            if report is not None:
+                self.record = report.record(cpp, target)
+                start = time.perf_counter()
             try:
-                cpp_contents = cpp.get_contents()
-                if moc_options['gobble_comments']:
-                    cpp_contents = self.ccomment.sub('', cpp_contents)
-                    cpp_contents = self.cxxcomment.sub('', cpp_contents)
-                cpp_contents = self.literal_qobject.sub('""', cpp_contents)
+                cpp_verdict = self.scan(cpp, moc_options)
             except: continue # may be an still not generated source
             
             if moc_options['auto_scan_strategy'] == 0:
                 # Default Automoc strategy (Q_OBJECT driven)
                 self.__automoc_strategy_simple(env, moc_options,
-                                               cpp, cpp_contents, out_sources)
+                                               cpp, cpp_verdict, out_sources)
             else:
                 # Automoc strategy #1 (include driven)
                 self.__automoc_strategy_include_driven(env, moc_options,
-                                                       cpp, cpp_contents, out_sources)
+                                                       cpp, cpp_verdict, out_sources)
+            if report is not None:
+                self.record['time'] = time.perf_counter() - start
+        self.record = None
+        self.prefetched = {}
+        self.prefetched_stats = {}
+
+        if self.removed_sources:
+            out_sources = [s for idx, s in enumerate(out_sources)
+                           if idx not in self.removed_sources]
+        self.source_index = {}
+        self.removed_sources = set()
+
+        if self.unity_mocs:
+            out_sources.extend(self.compile_unity(env, moc_options,
+                                                  target, self.unity_mocs))
+        self.unity_mocs = []
+        self.target = None
+        self.pch = None
 
         # restore the original env attributes (FIXME)
         self.objBuilder.env = objBuilderEnv
         env.Moc5.env = mocBuilderEnv
         env.XMoc5.env = xMocBuilderEnv
 
-        # We return the set of source entries as sorted sequence, else
-        # the order might accidentally change from one build to another
-        # and trigger unwanted rebuilds. For proper sorting, a key function
-        # has to be specified...FS.Entry (and Base nodes in general) do not
-        # provide a __cmp__, for performance reasons. 
-        return (target, sorted(set(out_sources), key=lambda entry : str(entry)))
+        # We return the source entries without duplicates, in the order
+        # they were given and added above. That order is stable from one
+        # build to another, so there's no need to sort them by their names
+        # (which would stringify every node).
+        seen = set()
+        unique_sources = []
+        for s in out_sources:
+            if s not in seen:
+                seen.add(s)
+                unique_sources.append(s)
+        return (target, unique_sources)
+
+# the precompiled Qt headers of QT5_MOC_PCH, by the hash of their contents
+# and flags, see _Automoc.precompiled_header()
+_moc_pch_nodes = {}
 
 AutomocShared = _Automoc('SharedObject')
 AutomocStatic = _Automoc('StaticObject')
@@ -397,17 +1118,27 @@ def _detect(env):
     try: return os.environ['QTDIR']
     except KeyError: pass
 
-    moc = env.WhereIs('moc-qt5') or env.WhereIs('moc5') or env.WhereIs('moc')
+    # Searching the PATH and asking moc for its version is expensive,
+    # so the results get remembered for the given PATH
+    key = env['ENV'].get('PATH', '')
+    detected = _toolchain_lookup(env, 'detect', key)
+    if detected is not None:
+        moc, vernumber = detected
+    else:
+        moc = env.WhereIs('moc-qt5') or env.WhereIs('moc5') or env.WhereIs('moc')
+        vernumber = None
+        if moc:
+            pipes = subprocess.Popen('%s -v' % moc,
+                                     shell=True, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE,
+                                     close_fds=True)
+            vernumber = mocver_re.match(pipes.stdout.read())
+            if vernumber:
+                vernumber = [ int(x) for x in vernumber.groups() ]
+            _toolchain_store(env, 'detect', key, moc, (moc, vernumber))
     if moc:
-        pipes = subprocess.Popen('%s -v' % moc,
-                                 shell=True, stdin=subprocess.PIPE,
-                                 stdout=subprocess.PIPE,
-                                 stderr=subprocess.PIPE,
-                                 close_fds=True)
-        vernumber = pipes.stdout.read()
-        vernumber = mocver_re.match(vernumber)
         if vernumber:
-            vernumber = [ int(x) for x in vernumber.groups() ]
             if vernumber < [5, 0, 0]:
                 vernumber = '.'.join([str(x) for x in vernumber])
                 moc = None
@@ -427,30 +1158,292 @@ def _detect(env):
     return None
 
 
-def __scanResources(node, env, path, arg):
-    # Helper function for scanning .qrc resource files
-    # I've been careful on providing names relative to the qrc file
-    # If that was not needed this code could be simplified a lot
-    def recursiveFiles(basepath, path) :
-        result = []
-        for item in os.listdir(os.path.join(basepath, path)) :
+# Bump this whenever the format of the parsed qrc entries changes
+_QRC_SCAN_VERSION = 1
+
+def _parse_qrc(contents):
+    """
+    Parses the contents of a .qrc file and returns a tuple of
+    (file, alias, prefix) entries, with alias None if not given.
+    """
+    entries = []
+    state = {'prefix' : '', 'alias' : None, 'text' : None}
+    def start_element(name, attrs):
+        if name == 'qresource':
+            state['prefix'] = attrs.get('prefix', '')
+        elif name == 'file':
+            state['alias'] = attrs.get('alias')
+            state['text'] = []
+    def end_element(name):
+        if name == 'file' and state['text'] is not None:
+            entries.append((''.join(state['text']).strip(),
+                            state['alias'], state['prefix']))
+            state['text'] = None
+    def character_data(data):
+        if state['text'] is not None:
+            state['text'].append(data)
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = character_data
+    try:
+        parser.Parse(contents, True)
+    except xml.parsers.expat.ExpatError:
+        # not well-formed, fall back to searching for the <file> tags
+        # we assume the default xml encoding (utf-8) here
+        return tuple((f, None, '') for f in
+                     qrcinclude_re.findall(contents.decode('utf-8', 'replace')))
+    return tuple(entries)
+
+_qrc_entries_memo = {}
+
+def _qrc_entries(node, env):
+    """
+    Returns the parsed entries (see _parse_qrc) of the given .qrc node,
+    memoized by its content signature. With a QT5_CACHEFILE, they
+    get stored across runs too.
+    """
+    key = (_QRC_SCAN_VERSION, node.get_csig())
+    try:
+        return _qrc_entries_memo[key]
+    except KeyError:
+        pass
+    cache = _get_cache(env)
+    entries = None
+    if cache is not None:
+        entries = cache.get('qrc', key)
+    if entries is None:
+        entries = _parse_qrc(node.get_contents())
+        if cache is not None:
+            cache.put('qrc', key, entries)
+    _qrc_entries_memo[key] = entries
+    return entries
+
+_qrc_listing_memo = {}
+
+def _qrc_folder(env, path):
+    """
+    Returns the entry (mtime, listing, subdirs) for the given directory,
+    or None if it isn't a directory. The listing is a tuple of
+    (name, isdir) pairs in the order of os.listdir(), subdirs the set
+    of the names of its subdirectories. Entries are remembered along
+    with the mtime of the directory, so only directories that changed
+    get listed again (and, with a QT5_CACHEFILE, across runs as well).
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    entry = _qrc_listing_memo.get(path)
+    if entry is not None and entry[0] == mtime:
+        return entry
+    cache = _get_cache(env)
+    listing = None
+    if cache is not None:
+        cached = cache.get('qrcdirs', path)
+        if cached is not None and cached[0] == mtime:
+            listing = cached[1]
+    if listing is None:
+        try:
+            listing = tuple((e.name, e.is_dir()) for e in os.scandir(path))
+        except OSError:
+            return None
+        if cache is not None:
+            cache.put('qrcdirs', path, (mtime, listing))
+    entry = (mtime, listing, frozenset(name for name, isdir in listing if isdir))
+    _qrc_listing_memo[path] = entry
+    return entry
+
+def _qrc_listing(env, path):
+    """
+    Returns the entries of the given directory as a tuple of
+    (name, isdir) pairs, or None if it isn't a directory.
+    """
+    entry = _qrc_folder(env, path)
+    if entry is None:
+        return None
+    return entry[1]
+
+def _qrc_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+_qrc_files_memo = {}
+
+def _qrc_files(node, env):
+    """
+    Returns the files of the given .qrc node relative to its folder,
+    with the listed folders expanded recursively. The result is
+    memoized by the content signature of the node (with a QT5_CACHEFILE
+    across runs too) and stays valid as long as none of the folders
+    that were looked at changes its mtime.
+    """
+    qrcpath = os.path.dirname(node.get_abspath())
+    key = (_QRC_SCAN_VERSION, node.get_csig(), qrcpath)
+    entry = _qrc_files_memo.get(key)
+    cache = _get_cache(env)
+    if entry is None and cache is not None:
+        entry = cache.get('qrcfiles', key)
+    if entry is not None and all(_qrc_mtime(p) == m for p, m in entry[1]):
+        _qrc_files_memo[key] = entry
+        return list(entry[0])
+
+    # the folders that were looked at, by path
+    folders = {}
+    def folder(path):
+        if path not in folders:
+            folders[path] = _qrc_folder(env, path)
+        return folders[path]
+    # the folders of the entries, by their path relative to the qrc file
+    heads = {}
+    def isDir(path):
+        head, tail = os.path.split(path)
+        try:
+            entry = heads[head]
+        except KeyError:
+            entry = heads[head] = folder(os.path.join(qrcpath, head))
+        return entry is not None and tail in entry[2]
+    def recursiveFiles(path, result):
+        entry = folder(os.path.join(qrcpath, path))
+        for item, isdir in (entry[1] if entry is not None else ()):
             itemPath = os.path.join(path, item)
-            if os.path.isdir(os.path.join(basepath, itemPath)) :
-                result += recursiveFiles(basepath, itemPath)
+            if isdir:
+                recursiveFiles(itemPath, result)
             else:
                 result.append(itemPath)
-        return result
-    # we assume the default xml encoding (utf-8) here
-    contents = node.get_contents().decode('utf-8')
-    includes = qrcinclude_re.findall(contents)
-    qrcpath = os.path.dirname(node.path)
-    dirs = [included for included in includes if os.path.isdir(os.path.join(qrcpath,included))]
+
+    includes = [e[0] for e in _qrc_entries(node, env)]
+    dirs = [included for included in includes if isDir(included)]
     # dirs need to include files recursively
-    for dir in dirs :
-        includes.remove(dir)
-        includes+=recursiveFiles(qrcpath,dir)
+    if dirs:
+        dirset = set(dirs)
+        includes = [included for included in includes if included not in dirset]
+        for dir in dirs:
+            recursiveFiles(dir, includes)
+
+    stamps = tuple((path, e[0] if e is not None else None)
+                   for path, e in folders.items())
+    entry = (tuple(includes), stamps)
+    _qrc_files_memo[key] = entry
+    if cache is not None:
+        cache.put('qrcfiles', key, entry)
     return includes
 
+def __scanResources(node, env, path, arg):
+    # Helper function for scanning .qrc resource files
+    # I've been careful on providing names relative to the qrc file
+    # If that was not needed this code could be simplified a lot
+    return _qrc_files(node, env)
+
+qmlimport_re = re.compile(r'^\s*import\s+"([^"]+)"', re.M)
+
+def __scanQml(node, env, path, arg):
+    # Helper function for scanning .qml files, a local directory
+    # import depends on the QML files and the qmldir of that folder,
+    # a JavaScript import on the given file
+    contents = node.get_text_contents()
+    result = []
+    for imported in qmlimport_re.findall(contents):
+        if ':' in imported.split('/')[0]:
+            # remote (URL) or resource import
+            continue
+        folder = os.path.join(os.path.dirname(node.get_abspath()), imported)
+        listing = _qrc_listing(env, folder)
+        if listing is None:
+            # a JS file, or a folder that doesn't exist (yet)
+            entry = node.dir.Entry(imported)
+            if entry.is_derived() or entry.rexists():
+                result.append(entry)
+            continue
+        for name, isdir in listing:
+            if not isdir and (name == 'qmldir' or name.endswith('.qml')):
+                result.append(node.dir.Dir(imported).File(name))
+    return result
+
+# Bump this whenever the format of the parsed ui includes changes
+_UI_SCAN_VERSION = 1
+
+def _parse_ui(contents):
+    """
+    Parses the contents of a .ui file and returns a tuple of the
+    headers of its custom widgets and of its <include> elements,
+    as (name, is_global) pairs.
+    """
+    includes = []
+    state = {'text' : None, 'global' : False}
+    def start_element(name, attrs):
+        if name == 'header' or name == 'include':
+            state['text'] = []
+            state['global'] = attrs.get('location') == 'global'
+    def end_element(name):
+        if (name == 'header' or name == 'include') and state['text'] is not None:
+            include = ''.join(state['text']).strip()
+            if include:
+                includes.append((include, state['global']))
+            state['text'] = None
+    def character_data(data):
+        if state['text'] is not None:
+            state['text'].append(data)
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = character_data
+    try:
+        parser.Parse(contents, True)
+    except xml.parsers.expat.ExpatError:
+        # uic will complain about it anyway
+        pass
+    return tuple(includes)
+
+_ui_includes_memo = {}
+
+def _ui_includes(node, env):
+    """
+    Returns the parsed includes (see _parse_ui) of the given .ui node,
+    memoized by its content signature. With a QT5_CACHEFILE, they
+    get stored across runs too.
+    """
+    key = (_UI_SCAN_VERSION, node.get_csig())
+    try:
+        return _ui_includes_memo[key]
+    except KeyError:
+        pass
+    cache = _get_cache(env)
+    includes = None
+    if cache is not None:
+        includes = cache.get('ui', key)
+    if includes is None:
+        includes = _parse_ui(node.get_contents())
+        if cache is not None:
+            cache.put('ui', key, includes)
+    _ui_includes_memo[key] = includes
+    return includes
+
+_ui_search_indexes = {}
+
+def __scanUi(node, env, path, arg):
+    # Helper function for scanning .ui files, the headers of custom
+    # widgets and the additional includes get searched in the CPPPATH.
+    # Local includes are also looked up in the folder of the .ui file,
+    # which is where the generated header ends up.
+    result = []
+    for include, is_global in _ui_includes(node, env):
+        if is_global:
+            dirs = tuple(path)
+        else:
+            dirs = (node.dir,) + tuple(path)
+        try:
+            index = _ui_search_indexes[dirs]
+        except KeyError:
+            index = _SearchPathIndex(dirs)
+            _ui_search_indexes[dirs] = index
+        found = index.find(include, env.File)
+        if found is not None:
+            result.append(found)
+    return result
+
 #
 # Scanners
 #
@@ -459,6 +1452,18 @@ __qrcscanner = SCons.Scanner.Scanner(name = 'qrcfile',
     argument = None,
     skeys = ['.qrc'])
 
+__qmlscanner = SCons.Scanner.Scanner(name = 'qmlfile',
+    function = __scanQml,
+    argument = None,
+    skeys = ['.qml'],
+    recursive = True)
+
+__uiscanner = SCons.Scanner.Scanner(name = 'uifile',
+    function = __scanUi,
+    argument = None,
+    path_function = SCons.Scanner.FindPathDirs('CPPPATH'),
+    skeys = ['.ui'])
+
 #
 # Emitters
 #
@@ -485,63 +1490,151 @@ def __qrc_emitter(target, source, env):
 #
 # Action generators
 #
-def __moc_generator_from_h(source, target, env, for_signature):
-    pass_defines = False
+def _moc_depfile_extra(node, env, deps):
+    """
+    Returns the files of deps, that aren't among the sources and the
+    implicit dependencies of the moc'ed file node yet, sorted by their
+    paths, as the nodes that exist or get built.
+    """
+    known = set(n.get_abspath() for n in node.sources)
+    known.update(n.get_abspath() for n in node.implicit or [])
+    extra = []
+    for d in sorted(set(deps) - known):
+        n = env.File(d)
+        if n.is_derived() or n.rexists():
+            extra.append(n)
+    return extra
+
+def __moc_record_deps(target, source, env):
+    # parse the new depfile right away, and remember its contents
+    # for the next run. The files that the C scanner didn't find get
+    # added to the dependencies that are stored for the target now,
+    # in the same order as the target scanner returns them in the
+    # next run, such that the target is up to date then.
+    deps = _moc_depfile_deps(env, target[0].get_abspath() + '.d')
+    if deps:
+        for t in target:
+            t.add_to_implicit(_moc_depfile_extra(t, env, deps))
+    return 0
+
+def _moc_predefs_enabled(env):
     try:
-        if int(env.subst('$QT5_CPPDEFINES_PASSTOMOC')) == 1:
-            pass_defines = True
+        return (int(env.subst('$QT5_MOC_PREDEFS')) == 1 and
+                int(env.subst('$QT5_CPPDEFINES_PASSTOMOC')) == 1)
     except ValueError:
-        pass
-    
-    if pass_defines:
-        return '$QT5_MOC $QT5_MOCDEFINES $QT5_MOCFROMHFLAGS $QT5_MOCINCFLAGS -o $TARGET $SOURCE'
+        return False
+
+_moc_predefs_nodes = {}
+
+def _moc_predefs(env, target):
+    """
+    Returns the node of the header with the CPPDEFINES of env, for
+    passing them to moc with --include. The header is named after a
+    hash of its contents, such that all environments with the same
+    defines share it (and the moc command lines stay the same). It gets
+    written to QT5_MOCPREDEFSDIR, or next to the first moc'ed file that
+    needs it, such that it ends up in the build folder.
+    """
+    defines = env.get('CPPDEFINES')
+    folder = env.subst('$QT5_MOCPREDEFSDIR')
+    key = repr(defines)
+    if '$' in key:
+        key = None
+    else:
+        key = (key, folder)
+        try:
+            return _moc_predefs_nodes[key]
+        except KeyError:
+            pass
+    lines = []
+    for define in SCons.Defaults.processDefines(defines):
+        name, sep, value = env.subst(define).partition('=')
+        if not sep:
+            value = '1'
+        lines.append('#define %s %s\n' % (name, value))
+    text = ''.join(lines)
+    name = 'moc_predefs_%s.h' % hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+    if folder:
+        node = env.Dir(folder).File(name)
     else:
-        return '$QT5_MOC $QT5_MOCFROMHFLAGS $QT5_MOCINCFLAGS -o $TARGET $SOURCE'
+        node = target[0].get_dir().File(name)
+    if not node.has_builder():
+        __moc_predefs_builder.__call__(env, node, env.Value(text))
+    if key is not None:
+        _moc_predefs_nodes[key] = node
+    return node
+
+def __moc_emitter(target, source, env):
+    if _moc_depfile_enabled(env):
+        for t in target:
+            env.Clean(t, t.get_abspath() + '.d')
+    if _moc_predefs_enabled(env):
+        env.Depends(target, _moc_predefs(env, target))
+    return target, source
+
+def __moc_target_scan(node, env, path):
+    """
+    Target scanner for the moc builders. With QT5_MOC_DEPFILE, the
+    files in the depfile of the last moc run, that the C scanner didn't
+    find for the source, become dependencies of the moc'ed file as well.
+    """
+    if not _moc_depfile_enabled(env):
+        return []
+    deps = _moc_depfile_deps(env, node.get_abspath() + '.d')
+    if not deps:
+        return []
+    return _moc_depfile_extra(node, env, deps)
 
-def __moc_generator_from_cxx(source, target, env, for_signature):
+__moctargetscanner = SCons.Scanner.Scanner(name = 'moctarget',
+                                           function = __moc_target_scan)
+
+def __moc_command(env, target, flags, from_cxx):
     pass_defines = False
     try:
         if int(env.subst('$QT5_CPPDEFINES_PASSTOMOC')) == 1:
             pass_defines = True
     except ValueError:
         pass
-    
-    if pass_defines:
-        return ['$QT5_MOC $QT5_MOCDEFINES $QT5_MOCFROMCXXFLAGS $QT5_MOCINCFLAGS -o $TARGET $SOURCE',
-                SCons.Action.Action(checkMocIncluded,None)]
-    else:
-        return ['$QT5_MOC $QT5_MOCFROMCXXFLAGS $QT5_MOCINCFLAGS -o $TARGET $SOURCE',
-                SCons.Action.Action(checkMocIncluded,None)]
+    depfile = _moc_depfile_enabled(env)
+
+    cmd = '$QT5_MOC'
+    if pass_defines and _moc_predefs_enabled(env):
+        cmd += ' --include %s' % _moc_predefs(env, target)
+    elif pass_defines:
+        cmd += ' $QT5_MOCDEFINES'
+    cmd += ' %s $QT5_MOCINCFLAGS' % flags
+    if depfile:
+        cmd += ' $QT5_MOCDEPFILEFLAGS'
+    cmd += ' -o $TARGET $SOURCE'
+
+    actions = [cmd]
+    if depfile:
+        actions.append(SCons.Action.Action(__moc_record_deps, None))
+    if from_cxx:
+        actions.append(SCons.Action.Action(checkMocIncluded, None))
+    if len(actions) == 1:
+        return cmd
+    return actions
+
+def __moc_generator_from_h(source, target, env, for_signature):
+    return __moc_command(env, target, '$QT5_MOCFROMHFLAGS', False)
+
+def __moc_generator_from_cxx(source, target, env, for_signature):
+    return __moc_command(env, target, '$QT5_MOCFROMCXXFLAGS', True)
 
 def __mocx_generator_from_h(source, target, env, for_signature):
-    pass_defines = False
-    try:
-        if int(env.subst('$QT5_CPPDEFINES_PASSTOMOC')) == 1:
-            pass_defines = True
-    except ValueError:
-        pass
-    
-    if pass_defines:
-        return '$QT5_MOC $QT5_MOCDEFINES $QT5_MOCFROMHFLAGS $QT5_MOCINCFLAGS -o $TARGET $SOURCE'
-    else:
-        return '$QT5_MOC $QT5_MOCFROMHFLAGS $QT5_MOCINCFLAGS -o $TARGET $SOURCE'
+    return __moc_command(env, target, '$QT5_MOCFROMHFLAGS', False)
 
 def __mocx_generator_from_cxx(source, target, env, for_signature):
-    pass_defines = False
-    try:
-        if int(env.subst('$QT5_CPPDEFINES_PASSTOMOC')) == 1:
-            pass_defines = True
-    except ValueError:
-        pass
-    
-    if pass_defines:
-        return ['$QT5_MOC $QT5_MOCDEFINES $QT5_MOCFROMCXXFLAGS $QT5_MOCINCFLAGS -o $TARGET $SOURCE',
-                SCons.Action.Action(checkMocIncluded,None)]
-    else:
-        return ['$QT5_MOC $QT5_MOCFROMCXXFLAGS $QT5_MOCINCFLAGS -o $TARGET $SOURCE',
-                SCons.Action.Action(checkMocIncluded,None)]
+    return __moc_command(env, target, '$QT5_MOCFROMCXXFLAGS', True)
 
-def __qrc_generator(source, target, env, for_signature):
+def __qrc_command(source, env, flags=''):
+    """
+    Returns the rcc command for the given .qrc source, with the
+    additional flags inserted in front of the source. If the
+    QT5_QRCFLAGS don't define a -name, it gets derived from the
+    basename of the .qrc file.
+    """
     name_defined = False
     try:
         if env.subst('$QT5_QRCFLAGS').find('-name') >= 0:
@@ -549,10 +1642,11 @@ def __qrc_generator(source, target, env, for_signature):
     except ValueError:
         pass
     
+    if flags:
+        flags += ' '
     if name_defined:
-        return '$QT5_RCC $QT5_QRCFLAGS $SOURCE -o $TARGET'
+        return '$QT5_RCC $QT5_QRCFLAGS %s$SOURCE -o $TARGET' % flags
     else:
-        qrc_suffix = env.subst('$QT5_QRCSUFFIX')
         src = str(source[0])
         head, tail = os.path.split(src)
         if tail:
@@ -562,7 +1656,47 @@ def __qrc_generator(source, target, env, for_signature):
             qrc_stem = src[:-len(qrc_suffix)]
         else:
             qrc_stem = src
-        return '$QT5_RCC $QT5_QRCFLAGS -name %s $SOURCE -o $TARGET' % qrc_stem
+        return '$QT5_RCC $QT5_QRCFLAGS -name %s %s$SOURCE -o $TARGET' % (qrc_stem, flags)
+
+def __qrc_generator(source, target, env, for_signature):
+    return __qrc_command(source, env)
+
+def __qrc_big_generator(source, target, env, for_signature):
+    return __qrc_command(source, env, '$QT5_QRCBIGPASS1FLAGS')
+
+def __qrc_big_obj_generator(source, target, env, for_signature):
+    return __qrc_command(source, env, '$QT5_QRCBIGPASS2FLAGS')
+
+def __rcc_binary_flags(env):
+    """
+    Returns the rcc flags for a binary resource file, with the
+    compression settings of the given environment.
+    """
+    flags = ['-binary']
+    compress = env.subst('$QT5_RCC_COMPRESS')
+    if compress == '0':
+        flags.append('-no-compress')
+    elif compress:
+        flags.extend(['-compress', compress])
+    threshold = env.subst('$QT5_RCC_THRESHOLD')
+    if threshold:
+        flags.extend(['-threshold', threshold])
+    return ' '.join(flags)
+
+def __rcc_binary_generator(source, target, env, for_signature):
+    return '$QT5_RCC $QT5_QRCFLAGS %s $QT5_RCCBINARYFLAGS $SOURCE -o $TARGET' % __rcc_binary_flags(env)
+
+def __ts_merge_generator(source, target, env, for_signature):
+    # The existing .ts file comes last, such that its translations
+    # take precedence over the (empty) ones of the fragments
+    if os.path.exists(target[0].get_abspath()):
+        return '$QT5_LCONVERT $QT5_LCONVERTFLAGS $SOURCES $( $TARGET $) -o $TARGET'
+    return '$QT5_LCONVERT $QT5_LCONVERTFLAGS $SOURCES -o $TARGET'
+
+def __moc_unity_write(target, source, env):
+    with open(str(target[0]), 'w') as f:
+        f.write(source[0].get_text_contents())
+    return 0
 
 #
 # Builders
@@ -571,10 +1705,24 @@ __ts_builder = SCons.Builder.Builder(
         action = SCons.Action.Action('$QT5_LUPDATECOM','$QT5_LUPDATECOMSTR'),
         suffix = '.ts',
         source_factory = SCons.Node.FS.Entry)
+__ts_merge_builder = SCons.Builder.Builder(
+        action = SCons.Action.CommandGeneratorAction(__ts_merge_generator,
+                                                    {'cmdstr':'$QT5_LCONVERTCOMSTR'}),
+        suffix = '.ts')
 __qm_builder = SCons.Builder.Builder(
         action = SCons.Action.Action('$QT5_LRELEASECOM','$QT5_LRELEASECOMSTR'),
         src_suffix = '.ts',
         suffix = '.qm')
+# lrelease writes the .qm files next to the .ts files, when called
+# without -qm. All .qm files of an environment, that are out of date,
+# get released by a single call.
+__qm_batch_builder = SCons.Builder.Builder(
+        action = SCons.Action.Action('$QT5_LRELEASEBATCHCOM','$QT5_LRELEASECOMSTR',
+                                     batch_key = True,
+                                     targets = '$CHANGED_TARGETS'),
+        src_suffix = '.ts',
+        suffix = '.qm',
+        single_source = 1)
 __qrc_builder = SCons.Builder.Builder(
         action = SCons.Action.CommandGeneratorAction(__qrc_generator,
                                                     {'cmdstr':'$QT5_QRCCOMSTR'}),
@@ -583,17 +1731,112 @@ __qrc_builder = SCons.Builder.Builder(
         suffix = '$QT5_QRCCXXSUFFIX',
         prefix = '$QT5_QRCCXXPREFIX',
         single_source = 1)
+__qrc_big_builder = SCons.Builder.Builder(
+        action = SCons.Action.CommandGeneratorAction(__qrc_big_generator,
+                                                    {'cmdstr':'$QT5_QRCCOMSTR'}),
+        source_scanner = __qrcscanner,
+        src_suffix = '$QT5_QRCSUFFIX',
+        suffix = '$QT5_QRCCXXSUFFIX',
+        prefix = '$QT5_QRCCXXPREFIX',
+        single_source = 1)
+# The sources are the .qrc file and the object of the first pass,
+# only the former has to get scanned for resources
+__qrc_big_obj_builder = SCons.Builder.Builder(
+        action = SCons.Action.CommandGeneratorAction(__qrc_big_obj_generator,
+                                                    {'cmdstr':'$QT5_QRCBIGCOMSTR'}),
+        source_scanner = SCons.Scanner.Scanner({'.qrc' : __qrcscanner}))
+__rcc_binary_builder = SCons.Builder.Builder(
+        action = SCons.Action.CommandGeneratorAction(__rcc_binary_generator,
+                                                    {'cmdstr':'$QT5_RCCBINARYCOMSTR'}),
+        source_scanner = __qrcscanner,
+        src_suffix = '$QT5_QRCSUFFIX',
+        suffix = '$QT5_RCCBINARYSUFFIX',
+        single_source = 1)
+# The sources are the QML/JS file and its .qrc
+__qmlcache_builder = SCons.Builder.Builder(
+        action = SCons.Action.Action('$QT5_QMLCACHECOM', '$QT5_QMLCACHECOMSTR'),
+        source_scanner = SCons.Scanner.Scanner({'.qml' : __qmlscanner}))
+__qmlcache_filter_builder = SCons.Builder.Builder(
+        action = SCons.Action.Action('$QT5_QMLCACHEFILTERCOM', '$QT5_QMLCACHECOMSTR'),
+        single_source = 1)
+# The sources are the original and the filtered .qrc
+__qmlcache_loader_builder = SCons.Builder.Builder(
+        action = SCons.Action.Action('$QT5_QMLCACHELOADERCOM', '$QT5_QMLCACHECOMSTR'))
+__moc_predefs_builder = SCons.Builder.Builder(
+        action = SCons.Action.Action(__moc_unity_write, '$QT5_MOCPREDEFSCOMSTR'))
+# Precompiled Qt headers for the moc'ed files (QT5_MOC_PCH)
+__moc_pch_builder = SCons.Builder.Builder(
+        action = SCons.Action.Action('$QT5_MOCPCHCOM', '$QT5_MOCPCHCOMSTR'),
+        source_scanner = SCons.Tool.CScanner)
+__moc_shpch_builder = SCons.Builder.Builder(
+        action = SCons.Action.Action('$QT5_MOCSHPCHCOM', '$QT5_MOCSHPCHCOMSTR'),
+        source_scanner = SCons.Tool.CScanner)
+def _moc_precompile(env, header, shared):
+    """Returns the precompiled version of the given header."""
+    if shared:
+        builder = __moc_shpch_builder
+    else:
+        builder = __moc_pch_builder
+    gch = header.get_dir().File(header.name + env.subst('$QT5_MOCPCHSUFFIX'))
+    return builder.__call__(env, gch, header)
+
 __ex_moc_builder = SCons.Builder.Builder(
         action = SCons.Action.CommandGeneratorAction(__moc_generator_from_h,
-                                                  {'cmdstr':'$QT5_MOCFROMHCOMSTR'}))
+                                                  {'cmdstr':'$QT5_MOCFROMHCOMSTR'}),
+        emitter = __moc_emitter,
+        target_scanner = __moctargetscanner)
 __ex_uic_builder = SCons.Builder.Builder(
         action = SCons.Action.Action('$QT5_UICCOM', '$QT5_UICCOMSTR'),
+        source_scanner = __uiscanner,
         src_suffix = '.ui')
 
 
 #
 # Wrappers (pseudo-Builders)
 #
+def __ts_shards(env, source):
+    """
+    Splits the given sources for lupdate into shards, as selected by
+    QT5_LUPDATE_SHARD, and returns a list of (key, sources) pairs.
+    Returns None if the sources shouldn't get sharded.
+    """
+    mode = env.subst('$QT5_LUPDATE_SHARD')
+    if not mode:
+        return None
+    nodes = env.arg2nodes(source, env.fs.Entry)
+    if mode == 'dir':
+        dirs = {}
+        for node in nodes:
+            if isinstance(node.disambiguate(), SCons.Node.FS.Dir):
+                dir = node
+            else:
+                dir = node.dir
+            dirs.setdefault(dir.get_path(), []).append(node)
+        keys = {}
+        for path in dirs:
+            key = re.sub(r'[^A-Za-z0-9]+', '_', path).strip('_') or 'top'
+            keys.setdefault(key, []).append(path)
+        shards = []
+        for key, paths in keys.items():
+            for path in paths:
+                if len(paths) > 1:
+                    # different folders, like 'a-b' and 'a_b', map to the
+                    # same key...tell them apart by a hash of their paths
+                    shard = '%s_%s' % (key, hashlib.sha1(path.encode('utf-8')).hexdigest()[:8])
+                else:
+                    shard = key
+                shards.append((shard, dirs[path]))
+        return sorted(shards, key=lambda shard: shard[0])
+    try:
+        size = int(mode)
+    except ValueError:
+        size = 0
+    if size < 1:
+        raise SCons.Errors.UserError("QT5_LUPDATE_SHARD has to be 'dir' or a number of files, not '%s'" % mode)
+    nodes = sorted(nodes, key=str)
+    return [(str(k), nodes[i:i+size])
+            for k, i in enumerate(range(0, len(nodes), size))]
+
 def Ts5(env, target, source=None, *args, **kw):
     """
     A pseudo-Builder wrapper around the LUPDATE executable of Qt5.
@@ -614,9 +1857,24 @@ def Ts5(env, target, source=None, *args, **kw):
     except ValueError:
         pass
     
+    shards = __ts_shards(env, source)
+    fragments = None
     result = []
     for t in target:
-        obj = __ts_builder.__call__(env, t, source, **kw)
+        if shards is None:
+            obj = __ts_builder.__call__(env, t, source, **kw)
+        else:
+            if SCons.Util.is_String(t):
+                t = env.File(SCons.Util.adjustixes(t, '', '.ts'))
+            if fragments is None:
+                # The fragments contain the extracted messages only, so
+                # they are shared by all the .ts files of this call
+                stem = os.path.splitext(t.name)[0]
+                fragments = []
+                for key, nodes in shards:
+                    fragment = t.dir.File('%s_shard_%s.ts' % (stem, key))
+                    fragments.extend(__ts_builder.__call__(env, fragment, nodes, **kw))
+            obj = __ts_merge_builder.__call__(env, t, fragments, **kw)
         # Prevent deletion of the .ts file, unless explicitly specified
         if not clean_ts:
             env.NoClean(obj)
@@ -628,6 +1886,23 @@ def Ts5(env, target, source=None, *args, **kw):
 
     return result
 
+def __qm_batchable(env, target, source):
+    """
+    Returns whether the .qm target can be released in a batch, i.e.
+    has the same path as its .ts source, apart from the suffix.
+    """
+    if SCons.Util.is_String(target):
+        target = SCons.Util.adjustixes(target, '', '.qm')
+    if SCons.Util.is_String(source):
+        source = SCons.Util.adjustixes(source, '', '.ts')
+    target = env.File(target)
+    source = env.File(source)
+    if os.path.splitext(target.get_abspath())[0] != os.path.splitext(source.get_abspath())[0]:
+        return False
+    # A .ts file that isn't duplicated into a VariantDir gets read
+    # from the source folder, and lrelease would write the .qm there
+    return source.is_derived() or source.srcnode() is source or source.dir.duplicate
+
 def Qm5(env, target, source=None, *args, **kw):
     """
     A pseudo-Builder wrapper around the LRELEASE executable of Qt5.
@@ -640,7 +1915,23 @@ def Qm5(env, target, source=None, *args, **kw):
     if not SCons.Util.is_List(source):
         source = [source]
 
+    batch = False
+    try:
+        if int(env.subst('$QT5_LRELEASE_BATCH')) == 1:
+            batch = True
+    except ValueError:
+        pass
+
     result = []    
+    if batch and len(target) == len(source):
+        # Every .ts file gets released into its own .qm file
+        for t, s in zip(target, source):
+            if __qm_batchable(env, t, s):
+                result.extend(__qm_batch_builder.__call__(env, t, s, **kw))
+            else:
+                result.extend(__qm_builder.__call__(env, t, s, **kw))
+        return result
+
     for t in target:
         result.extend(__qm_builder.__call__(env, t, source, **kw))
 
@@ -658,12 +1949,185 @@ def Qrc5(env, target, source=None, *args, **kw):
     if not SCons.Util.is_List(source):
         source = [source]
 
+    qml_cache = False
+    try:
+        if int(env.subst('$QT5_QMLCACHE')) == 1:
+            qml_cache = True
+    except ValueError:
+        pass
+
+    result = []
+    for t, s in zip(target, source):
+        if qml_cache:
+            if t is s:
+                # no target given, name the outputs after the .qrc file
+                t = None
+            result.extend(__qml_cache(env, s, kw, t))
+        else:
+            result.extend(__qrc_builder.__call__(env, t, s, **kw))
+
+    return result
+
+def __qml_cache(env, qrc, kw, target=None):
+    """
+    Compiles the QML/JS files of the given .qrc file with qmlcachegen,
+    and returns the list of cxx files for the compiled units, the
+    loader and the remaining resources. If a target is given, the
+    outputs are named after it instead of the .qrc file.
+    """
+    qrc_suffix = env.subst('$QT5_QRCSUFFIX')
+    if SCons.Util.is_String(qrc):
+        qrc = SCons.Util.adjustixes(qrc, '', qrc_suffix)
+    qrc = env.File(qrc)
+    if not qrc.rexists():
+        # the QML files have to be known when reading the SConscripts
+        raise SCons.Errors.UserError("The .qrc file '%s' for qmlcachegen doesn't exist" % qrc)
+    suffixes = env.Flatten(env.get('QT5_QMLCACHESUFFIXES', []))
+    cxx_suffix = env.subst('$CXXFILESUFFIX')
+    if target is None:
+        stem = os.path.splitext(qrc.name)[0]
+        folder = qrc.dir
+    else:
+        target = env.File(SCons.Util.adjustixes(target,
+                                                env.subst('$QT5_QRCCXXPREFIX'),
+                                                env.subst('$QT5_QRCCXXSUFFIX')))
+        stem = os.path.splitext(target.name)[0]
+        folder = target.dir
+
+    result = []
+    for res in __scanResources(qrc, env, (), None):
+        base, ext = os.path.splitext(res)
+        if ext not in suffixes:
+            continue
+        unit = folder.File('%s_%s%s' % (base, ext[1:], cxx_suffix))
+        result.extend(__qmlcache_builder.__call__(env, unit, [qrc.dir.File(res), qrc], **kw))
+    # The compiled files get removed from the resources (the filtered
+    # .qrc stays next to the original, rcc resolves the files relative to it)...
+    filtered = __qmlcache_filter_builder.__call__(env,
+                   qrc.dir.File('%s_qmlcache%s' % (stem, qrc_suffix)), [qrc], **kw)
+    result.extend(__qrc_builder.__call__(env, target, filtered, **kw))
+    # ...and the loader registers the compiled units instead
+    result.extend(__qmlcache_loader_builder.__call__(env,
+                      folder.File('%s_qmlcache_loader%s' % (stem, cxx_suffix)),
+                      [qrc] + filtered, **kw))
+    return result
+
+def QmlCache5(env, target, source=None, *args, **kw):
+    """
+    A pseudo-Builder wrapper around the QMLCACHEGEN executable of Qt5,
+    compiles the QML/JS files of a .qrc file ahead of time.
+        qmlcachegen --resource=qrc-file -o out-file qml-file
+    """
+    if not SCons.Util.is_List(target):
+        target = [target]
+    if not source:
+        source = target[:]
+    if not SCons.Util.is_List(source):
+        source = [source]
+
+    result = []
+    for s in source:
+        result.extend(__qml_cache(env, s, kw))
+
+    return result
+
+def __rcc_binary_hash(env, qrc):
+    """
+    Returns a hash over the contents of the given .qrc file, the resources
+    it lists and the rcc flags, or None if the .qrc file doesn't exist yet.
+    """
+    qrc = qrc.srcnode()
+    if qrc.is_derived() or not qrc.rexists():
+        return None
+    contents = [env.subst('$QT5_QRCFLAGS %s $QT5_RCCBINARYFLAGS' % __rcc_binary_flags(env)),
+                qrc.get_csig()]
+    for res in __scanResources(qrc, env, (), None):
+        node = qrc.dir.File(res)
+        contents.append(res)
+        if node.rexists():
+            contents.append(node.get_csig())
+    return hashlib.sha256('\n'.join(contents).encode('utf-8')).hexdigest()
+
+def Rcc5Binary(env, target, source=None, *args, **kw):
+    """
+    A pseudo-Builder wrapper around the RCC executable of Qt5, for
+    binary resource files that get loaded at runtime.
+        rcc -binary [options] qrc-file -o rcc-file
+    """
+    if not SCons.Util.is_List(target):
+        target = [target]
+    if not source:
+        source = target[:]
+    if not SCons.Util.is_List(source):
+        source = [source]
+
+    hash_name = False
+    try:
+        if int(env.subst('$QT5_RCCBINARY_HASHNAME')) == 1:
+            hash_name = True
+    except ValueError:
+        pass
+
+    qrc_suffix = env.subst('$QT5_QRCSUFFIX')
+    result = []
+    for t, s in zip(target, source):
+        if SCons.Util.is_String(t) and t.endswith(qrc_suffix):
+            t = t[:-len(qrc_suffix)]
+        if hash_name and SCons.Util.is_String(t):
+            if SCons.Util.is_String(s):
+                s = SCons.Util.adjustixes(s, '', qrc_suffix)
+            digest = __rcc_binary_hash(env, env.File(s))
+            if digest:
+                t = '%s_%s' % (t, digest[:16])
+        result.extend(__rcc_binary_builder.__call__(env, t, s, **kw))
+
+    return result
+
+def __qrc_big(env, objBuilderName, shared, target, source, kw):
+    if not SCons.Util.is_List(target):
+        target = [target]
+    if not source:
+        source = target[:]
+    if not SCons.Util.is_List(source):
+        source = [source]
+
+    objBuilder = getattr(env, objBuilderName)
+    if shared:
+        objsuffix = env.subst('$SHOBJSUFFIX')
+    else:
+        objsuffix = env.subst('$OBJSUFFIX')
     result = []
     for t, s in zip(target, source):
-        result.extend(__qrc_builder.__call__(env, t, s, **kw))
+        for cxx in __qrc_big_builder.__call__(env, t, s, **kw):
+            base = os.path.splitext(str(cxx))[0]
+            # First pass: compile the stub with the placeholder data
+            tmp = objBuilder(base + env.subst('$QT5_QRCBIGTEMPSUFFIX'), cxx, **kw)
+            # Second pass: patch the resource data into the object
+            obj = __qrc_big_obj_builder.__call__(env, base + objsuffix,
+                                                 cxx.sources + tmp, **kw)
+            if shared:
+                for o in obj:
+                    o.attributes.shared = 1
+            result.extend(obj)
 
     return result
 
+def Qrc5Big(env, target, source=None, *args, **kw):
+    """
+    A pseudo-Builder wrapper around the two-pass mode of the RCC executable
+    of Qt5, for big resources. Returns the resulting (static) objects.
+        rcc -pass 1 [options] qrc-file -o out-file
+        rcc -pass 2 -temp tmp-object [options] qrc-file -o object
+    """
+    return __qrc_big(env, 'StaticObject', False, target, source, kw)
+
+def SharedQrc5Big(env, target, source=None, *args, **kw):
+    """
+    Like Qrc5Big, but returns shared objects for linking them into
+    a shared library.
+    """
+    return __qrc_big(env, 'SharedObject', True, target, source, kw)
+
 def ExplicitMoc5(env, target, source, *args, **kw):
     """
     A pseudo-Builder wrapper around the MOC executable of Qt5.
@@ -710,7 +2174,33 @@ def generate(env):
     ]
     command_suffixes = ['-qt5', '5', '']
         
+    def locateKey(env, command, qtdir) :
+        return (qtdir, command, env['ENV'].get('PATH', ''), env['ENV'].get('PATHEXT', ''))
+
     def locateQt5Command(env, command, qtdir) :
+        # The probing below gets done once per Qt installation only,
+        # as long as the found executable doesn't change
+        key = locateKey(env, command, qtdir)
+        fullpath = _toolchain_lookup(env, 'locate', key)
+        if fullpath is not None:
+            return fullpath
+        fullpath = probeQt5Command(env, command, qtdir)
+        _toolchain_store(env, 'locate', key,
+                         env.WhereIs(fullpath) or fullpath, fullpath)
+        return fullpath
+
+    def locateOptionalQt5Command(env, command, qtdir) :
+        # Only needed for some features, so we don't fail if it's missing
+        key = locateKey(env, command, qtdir)
+        if key in _toolchain_missing:
+            return command
+        try:
+            return locateQt5Command(env, command, qtdir)
+        except Exception:
+            _toolchain_missing.add(key)
+            return command
+
+    def probeQt5Command(env, command, qtdir) :
         triedPaths = []
         for suffix in suffixes :
             fullpath = os.path.join(qtdir,'bin',command + suffix)
@@ -739,14 +2229,27 @@ def generate(env):
         QT5_RCC = locateQt5Command(env,'rcc', env['QT5DIR']),
         QT5_LUPDATE = locateQt5Command(env,'lupdate', env['QT5DIR']),
         QT5_LRELEASE = locateQt5Command(env,'lrelease', env['QT5DIR']),
+        QT5_LCONVERT = locateOptionalQt5Command(env,'lconvert', env['QT5DIR']),
+        QT5_QMLCACHEGEN = locateOptionalQt5Command(env,'qmlcachegen', env['QT5DIR']),
 
         QT5_AUTOSCAN = 1, # Should the qt5 tool try to figure out, which sources are to be moc'ed?
         QT5_AUTOSCAN_STRATEGY = 0, # While scanning for files to moc, should we search for includes in qtsolutions style?
+        QT5_AUTOSCAN_JOBS = 1, # Number of threads that read and scan the files for the Automoc
         QT5_GOBBLECOMMENTS = 0, # If set to 1, comments are removed before scanning cxx/h files.
         QT5_CPPDEFINES_PASSTOMOC = 1, # If set to 1, all CPPDEFINES get passed to the moc executable.
         QT5_CLEAN_TS = 0, # If set to 1, translation files (.ts) get cleaned on 'scons -c'
+        QT5_LRELEASE_BATCH = 0, # If set to 1, all .qm files of an Environment get released by a single lrelease call
+        QT5_LUPDATE_SHARD = '', # If set to 'dir' or N, lupdate runs per folder or per N sources, and lconvert merges the results
         QT5_AUTOMOC_SCANCPPPATH = 1, # If set to 1, the CPPPATHs (or QT5_AUTOMOC_CPPPATH) get scanned for moc'able files
         QT5_AUTOMOC_CPPPATH = [], # Alternative paths that get scanned for moc files
+        QT5_AUTOMOC_UNITY = 0, # If set to N > 0, the moc'ed headers get compiled in N aggregate files per target
+        QT5_MOC_PCH = 0, # If set to 1, the moc'ed files of a target get compiled with precompiled Qt headers
+        QT5_CACHEFILE = env.get('QT5_CACHEFILE', ''), # If set, scan results get stored in this file and reused by subsequent runs
+        QT5_AUTOMOC_REPORT = '', # If set, counters and timings of the Automoc get written to this JSON (or .csv) file at exit
+        QT5_MOC_DEPFILE = 0, # If set to 1, moc writes a depfile that provides the dependencies of its targets
+        QT5_MOC_PREDEFS = 0, # If set to 1, the CPPDEFINES get passed to moc in a generated header
+        QT5_QMLCACHE = 0, # If set to 1, Qrc5 compiles the QML/JS files of the resources with qmlcachegen
+        QT5_RCCBINARY_HASHNAME = 0, # If set to 1, the names of binary resource files contain a hash of their inputs
 
         # Some Qt5 specific flags. I don't expect someone wants to
         # manipulate those ...
@@ -754,8 +2257,13 @@ def generate(env):
         QT5_MOCFROMHFLAGS = CLVar(''),
         QT5_MOCFROMCXXFLAGS = CLVar('-i'),
         QT5_QRCFLAGS = '',
+        QT5_RCCBINARYFLAGS = '',
+        QT5_RCC_COMPRESS = '', # Compression level for binary resources, '0' disables the compression
+        QT5_RCC_THRESHOLD = '', # Compression threshold (in percent) for binary resources
         QT5_LUPDATEFLAGS = '',
         QT5_LRELEASEFLAGS = '',
+        QT5_LCONVERTFLAGS = '',
+        QT5_QMLCACHEFLAGS = '',
 
         # suffixes/prefixes for the headers / sources to generate
         QT5_UISUFFIX = '.ui',
@@ -769,8 +2277,12 @@ def generate(env):
         QT5_QRCSUFFIX = '.qrc',
         QT5_QRCCXXSUFFIX = '$CXXFILESUFFIX',
         QT5_QRCCXXPREFIX = 'qrc_',
+        QT5_QRCBIGTEMPSUFFIX = '_pass1',
+        QT5_RCCBINARYSUFFIX = '.rcc',
+        QT5_QMLCACHESUFFIXES = ['.qml', '.js', '.mjs'],
         QT5_MOCDEFPREFIX = '-D',
         QT5_MOCDEFSUFFIX = '',
+        QT5_MOCDEPFILEFLAGS = '--output-dep-file --dep-file-path ${TARGET}.d',
 
         # For SCons >= 4.2.0
         QT5_MOCDEFINES = '${_defines(QT5_MOCDEFPREFIX, CPPDEFINES, QT5_MOCDEFSUFFIX, __env__, TARGET, SOURCE)}',
@@ -784,6 +2296,22 @@ def generate(env):
         QT5_UICCOM = '$QT5_UIC $QT5_UICFLAGS -o $TARGET $SOURCE',
         QT5_LUPDATECOM = '$QT5_LUPDATE $QT5_LUPDATEFLAGS $SOURCES -ts $TARGET',
         QT5_LRELEASECOM = '$QT5_LRELEASE $QT5_LRELEASEFLAGS -qm $TARGET $SOURCES',
+        QT5_LRELEASEBATCHCOM = '$QT5_LRELEASE $QT5_LRELEASEFLAGS $CHANGED_SOURCES',
+        QT5_QMLCACHECOM = '$QT5_QMLCACHEGEN $QT5_QMLCACHEFLAGS --resource=${SOURCES[1].abspath} -o $TARGET $SOURCE',
+        QT5_QMLCACHEFILTERCOM = '$QT5_QMLCACHEGEN --filter-resource-file -o $TARGET $SOURCE',
+        QT5_QMLCACHELOADERCOM = '$QT5_QMLCACHEGEN --resource-file-mapping=${SOURCES[0].abspath}=${SOURCES[1].abspath} -o $TARGET $SOURCE',
+        QT5_MOCUNITYCOMSTR = "Creating '$TARGET'",
+        QT5_MOCPREDEFSDIR = '', # next to the first moc'ed file that needs the header
+        QT5_MOCPREDEFSCOMSTR = "Creating '$TARGET'",
+        QT5_MOCPCHHEADERS = ['QtCore/QObject', 'QtCore/QByteArray', 'QtCore/QMetaType', 'memory'],
+        QT5_MOCPCHSUFFIX = '.gch',
+        QT5_MOCPCHCOM = '$CXX -o $TARGET -x c++-header -c $CXXFLAGS $CCFLAGS $_CCCOMCOM $SOURCES',
+        QT5_MOCPCHCOMSTR = '$CXXCOMSTR',
+        QT5_MOCSHPCHCOM = '$SHCXX -o $TARGET -x c++-header -c $SHCXXFLAGS $SHCCFLAGS $_CCCOMCOM $SOURCES',
+        QT5_MOCSHPCHCOMSTR = '$SHCXXCOMSTR',
+        QT5_QRCBIGPASS1FLAGS = '-pass 1',
+        QT5_QRCBIGPASS2FLAGS = '-pass 2 -temp ${SOURCES[1]}',
+        QT5_QRCBIGCOMSTR = '$QT5_QRCCOMSTR',
         
         # Specialized variables for the Extended Automoc support
         # (Strategy #1 for qtsolutions)
@@ -797,6 +2325,10 @@ def generate(env):
     env.AddMethod(Ts5, "Ts5")
     env.AddMethod(Qm5, "Qm5")
     env.AddMethod(Qrc5, "Qrc5")
+    env.AddMethod(Qrc5Big, "Qrc5Big")
+    env.AddMethod(SharedQrc5Big, "SharedQrc5Big")
+    env.AddMethod(Rcc5Binary, "Rcc5Binary")
+    env.AddMethod(QmlCache5, "QmlCache5")
     env.AddMethod(ExplicitMoc5, "ExplicitMoc5")
     env.AddMethod(ExplicitUic5, "ExplicitUic5")
 
@@ -806,13 +2338,14 @@ def generate(env):
         src_suffix='$QT5_UISUFFIX',
         suffix='$QT5_UICDECLSUFFIX',
         prefix='$QT5_UICDECLPREFIX',
+        source_scanner = __uiscanner,
         single_source = True
-        #TODO: Consider the uiscanner on new scons version
         )
     env['BUILDERS']['Uic5'] = uic5builder
 
     # Metaobject builder
-    mocBld = Builder(action={}, prefix={}, suffix={})
+    mocBld = Builder(action={}, prefix={}, suffix={},
+                     emitter=__moc_emitter, target_scanner=__moctargetscanner)
     for h in header_extensions:
         act = SCons.Action.CommandGeneratorAction(__moc_generator_from_h,
                                                   {'cmdstr':'$QT5_MOCFROMHCOMSTR'})
@@ -829,7 +2362,8 @@ def generate(env):
 
     # Metaobject builder for the extended auto scan feature 
     # (Strategy #1 for qtsolutions)
-    xMocBld = Builder(action={}, prefix={}, suffix={})
+    xMocBld = Builder(action={}, prefix={}, suffix={},
+                      emitter=__moc_emitter, target_scanner=__moctargetscanner)
     for h in header_extensions:
         act = SCons.Action.CommandGeneratorAction(__mocx_generator_from_h,
                                                   {'cmdstr':'$QT5_MOCXFROMHCOMSTR'})
@@ -844,6 +2378,11 @@ def generate(env):
         xMocBld.suffix[cxx] = '$QT5_XMOCCXXSUFFIX'
     env['BUILDERS']['XMoc5'] = xMocBld
 
+    # Writes the aggregate files for the QT5_AUTOMOC_UNITY mode
+    env['BUILDERS']['MocUnity5'] = Builder(
+        action = Action(__moc_unity_write, '$QT5_MOCUNITYCOMSTR'),
+        source_factory = env.Value)
+
     # Add the Qrc5 action to the CXX file builder (registers the
     # *.qrc extension with the Environment)     
     cfile_builder, cxxfile_builder = SCons.Tool.createCFileBuilders(env)
@@ -866,6 +2405,27 @@ def generate(env):
     # TODO: Does dbusxml2cpp need an adapter
     env.AddMethod(enable_modules, "EnableQt5Modules")
 
+_pkg_config_memo = {}
+
+def _pkg_config_flags(env, pcmodules):
+    """
+    Returns the flags of 'pkg-config --libs --cflags' for the given
+    modules, as parsed by env.ParseFlags(). pkg-config gets called only
+    once per set of modules, QT5DIR, PKG_CONFIG_PATH and PATH. The flags
+    are remembered for the current run only (and not in the
+    QT5_CACHEFILE), since they depend on the .pc files that pkg-config
+    finds, which may change without the pkg-config executable changing.
+    """
+    command = 'pkg-config %s --libs --cflags' % ' '.join(pcmodules)
+    key = (command, env.subst('$QT5DIR'),
+           env['ENV'].get('PKG_CONFIG_PATH', ''), env['ENV'].get('PATH', ''))
+    flags = _pkg_config_memo.get(key)
+    if flags is None:
+        flags = env.ParseFlags(env.backtick(command))
+        _pkg_config_memo[key] = flags
+    # MergeFlags may put the given lists into the environment as they are
+    return copy.deepcopy(flags)
+
 def enable_modules(self, modules, debug=False, crosscompiling=False) :
     import sys
 
@@ -952,7 +2512,7 @@ def enable_modules(self, modules, debug=False, crosscompiling=False) :
             pcmodules.remove("Qt5Assistant")
             pcmodules.append("Qt5AssistantClient")
         self.AppendUnique(RPATH=[os.path.join("$QT5DIR","lib")])
-        self.ParseConfig('pkg-config %s --libs --cflags'% ' '.join(pcmodules))
+        self.MergeFlags(_pkg_config_flags(self, pcmodules))
         self["QT5_MOCCPPPATH"] = self["CPPPATH"]
         return
     if sys.platform == "win32" or crosscompiling :
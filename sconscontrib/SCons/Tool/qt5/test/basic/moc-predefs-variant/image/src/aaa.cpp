@@ -0,0 +1,7 @@
+#include "aaa.h"
+
+int main() 
+{ 
+  aaa a; 
+  return 0; 
+}
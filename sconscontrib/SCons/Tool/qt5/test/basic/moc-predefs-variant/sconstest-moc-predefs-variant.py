@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2001-2010,2011,2012 The SCons Foundation
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+"""
+With QT5_MOC_PREDEFS, the header with the defines gets written to the
+variant dir of the moc'ed files, and not to the source folders. Setting
+QT5_MOCPREDEFSDIR writes it to the given folder instead.
+"""
+
+import glob
+import os
+
+import TestSCons
+
+test = TestSCons.TestSCons()
+test.dir_fixture('image')
+test.file_fixture('../../qtenv.py')
+test.file_fixture('../../../__init__.py','site_scons/site_tools/qt5/__init__.py')
+
+test.run()
+
+predefs = glob.glob(test.workpath('build', 'moc_predefs_*.h'))
+test.fail_test(len(predefs) != 1)
+test.must_contain(predefs[0], '#define VALUE 1')
+test.fail_test(glob.glob(test.workpath('moc_predefs*')))
+test.fail_test(glob.glob(test.workpath('src', 'moc_predefs_*.h')))
+
+test.up_to_date(arguments = '.')
+
+test.run(arguments = 'predefsdir=#gen')
+predefs = glob.glob(test.workpath('gen', 'moc_predefs_*.h'))
+test.fail_test(len(predefs) != 1)
+test.fail_test('--include ' + os.path.join('gen', 'moc_predefs_') not in test.stdout())
+
+test.pass_test()
+
+# Local Variables:
+# tab-width:4
+# indent-tabs-mode:nil
+# End:
+# vim: set expandtab tabstop=4 shiftwidth=4:
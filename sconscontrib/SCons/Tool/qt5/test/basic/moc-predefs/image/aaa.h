@@ -0,0 +1,14 @@
+#include <QObject>
+
+class aaa : public QObject
+{
+  Q_OBJECT
+
+public:
+  aaa() {};
+
+#ifdef WITH_SIGNAL
+signals:
+  void changed(int value);
+#endif
+};
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2001-2010,2011,2012 The SCons Foundation
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+"""
+Pass the CPPDEFINES to moc in a generated header (QT5_MOC_PREDEFS),
+instead of on the command line.
+"""
+
+import glob
+
+import TestSCons
+
+test = TestSCons.TestSCons()
+test.dir_fixture('image')
+test.file_fixture('../../qtenv.py')
+test.file_fixture('../../../__init__.py','site_scons/site_tools/qt5/__init__.py')
+
+aaa_exe = 'aaa' + TestSCons._exe
+moc = 'moc_aaa.cc'
+
+test.run(arguments = 'signal=1')
+
+predefs = glob.glob(test.workpath('moc_predefs_*.h'))
+test.fail_test(len(predefs) != 1)
+test.must_contain(predefs[0], '#define VALUE 1')
+test.must_contain(predefs[0], '#define WITH_SIGNAL 1')
+test.must_contain(moc, 'changed')
+test.fail_test('-DVALUE' in test.stdout())
+
+test.up_to_date(options = '-n', arguments = 'signal=1 ' + aaa_exe)
+
+# other defines result in another header, and a new moc run
+test.not_up_to_date(options = '-n', arguments = 'value=2 signal=1 ' + moc)
+test.run(arguments = moc)
+test.must_not_contain(moc, 'changed')
+
+test.pass_test()
+
+# Local Variables:
+# tab-width:4
+# indent-tabs-mode:nil
+# End:
+# vim: set expandtab tabstop=4 shiftwidth=4:
@@ -0,0 +1,12 @@
+#include <QtWidgets/QApplication>
+#include "ui_form.h"
+
+int main(int argc, char **argv)
+{
+    QApplication app(argc, argv);
+    QWidget w;
+    Ui::Form form;
+    form.setupUi(&w);
+
+    return 0;
+}
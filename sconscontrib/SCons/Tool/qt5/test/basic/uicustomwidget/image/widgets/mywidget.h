@@ -0,0 +1,12 @@
+#ifndef MYWIDGET_H
+#define MYWIDGET_H
+
+#include <QtWidgets/QWidget>
+
+class MyWidget : public QWidget
+{
+public:
+    MyWidget(QWidget *parent = 0) : QWidget(parent) {}
+};
+
+#endif
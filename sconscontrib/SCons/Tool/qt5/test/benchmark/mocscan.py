@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2001-2010,2011,2012 The SCons Foundation
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+#
+# mocscan.py
+#
+# Micro-benchmark for the Automoc scanner of the qt5 tool. Creates
+# a set of synthetic headers and sources in memory and reports the
+# throughput (in MB/s) of the single-pass lexer, compared to the
+# former way of scanning: removing comments and string literals
+# with regex substitutions first, and then searching the result
+# for the Q_OBJECT macro and the quoted #includes.
+#
+#
+#
+# Usage:
+#
+#   python mocscan.py [-files N] [-repeat N]
+#
+# The qt5 tool gets loaded from ../../__init__.py, so SCons has
+# to be importable.
+#
+
+import os, sys, re, time, random, importlib.util
+
+def load_tool():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', '..', '__init__.py')
+    spec = importlib.util.spec_from_file_location('qt5', path)
+    tool = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(tool)
+    return tool
+
+class FourPassScanner:
+    """ The Automoc scan as it was done before the single-pass lexer. """
+    def __init__(self):
+        self.qo_search = re.compile(br'[^A-Za-z0-9]Q_OBJECT[^A-Za-z0-9]')
+        self.ccomment = re.compile(br'/\*(.*?)\*/', re.S)
+        self.cxxcomment = re.compile(br'//.*$', re.M)
+        self.literal_qobject = re.compile(br'"[^\n]*Q_OBJECT[^\n]*"')
+        self.include_search = re.compile(br'^\s*#\s*include\s+"([^"]+)"', re.M)
+
+    def scan_contents(self, contents, moc_options):
+        if moc_options['gobble_comments']:
+            contents = self.ccomment.sub(b'', contents)
+            contents = self.cxxcomment.sub(b'', contents)
+        contents = self.literal_qobject.sub(b'""', contents)
+        macros = ()
+        if self.qo_search.search(contents):
+            macros = ('Q_OBJECT',)
+        includes = tuple(i.decode('utf-8', 'replace')
+                         for i in self.include_search.findall(contents))
+        return (macros, includes)
+
+def synthetic_file(rnd, idx):
+    """ Returns the contents of a header-like file, roughly 8-16kB. """
+    lines = ['// Copyright (c) The Authors. All rights reserved.',
+             '#ifndef FILE%d_H' % idx,
+             '#define FILE%d_H' % idx,
+             '#include <QObject>',
+             '#include "common%d.h"' % (idx % 7)]
+    for c in range(rnd.randint(4, 8)):
+        lines.append('/*')
+        lines.extend([' * Documentation for class C%d_%d, it\'s "quoted" here.' % (idx, c)] * rnd.randint(2, 6))
+        lines.append(' */')
+        lines.append('class C%d_%d : public QObject' % (idx, c))
+        lines.append('{')
+        if rnd.random() < 0.3:
+            lines.append('    Q_OBJECT')
+        for m in range(rnd.randint(10, 30)):
+            lines.append('    int method%d(int a, const char *s = "some text") const; // returns a' % m)
+            lines.append("    char sep%d() const { return '/'; }" % m)
+        lines.append('};')
+    lines.append('#endif')
+    return ('\n'.join(lines) + '\n').encode('ascii')
+
+def measure(scanner, files, moc_options, repeat):
+    best = None
+    for r in range(repeat):
+        start = time.perf_counter()
+        for f in files:
+            scanner.scan_contents(f, moc_options)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main(argv):
+    nfiles = 500
+    repeat = 5
+    args = list(argv)
+    while args:
+        a = args.pop(0)
+        if a == '-files':
+            nfiles = int(args.pop(0))
+        elif a == '-repeat':
+            repeat = int(args.pop(0))
+        else:
+            print(__doc__ if __doc__ else "Usage: python mocscan.py [-files N] [-repeat N]")
+            return 1
+
+    tool = load_tool()
+    rnd = random.Random(42)
+    files = [synthetic_file(rnd, i) for i in range(nfiles)]
+    total = float(sum(len(f) for f in files))
+    old = FourPassScanner()
+    new = tool._Automoc('StaticObject')
+
+    print("%d files, %.1f MB" % (nfiles, total / 1e6))
+    for gobble in (0, 1):
+        moc_options = {'gobble_comments' : gobble}
+        for f in files:
+            if old.scan_contents(f, moc_options)[0] != new.scan_contents(f, moc_options)[0]:
+                print("Warning: scanners disagree on Q_OBJECT (gobble_comments=%d)" % gobble)
+                break
+        t_old = measure(old, files, moc_options, repeat)
+        t_new = measure(new, files, moc_options, repeat)
+        print("gobble_comments=%d: four-pass %7.1f MB/s, single-pass %7.1f MB/s (x%.2f)" %
+              (gobble, total / t_old / 1e6, total / t_new / 1e6, t_old / t_new))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2001-2010,2011,2012 The SCons Foundation
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+#
+#
+# qtproject.py
+#
+# Scaling benchmark for the qt5 tool. Where create_scons_tests.py
+# turns the Qt examples into SCons projects, this script synthesizes
+# a large Qt project instead: N header/source pairs (a given fraction
+# of them with the Q_OBJECT macro), spread over several directories,
+# plus a number of .ui forms and .qrc resource files.
+#
+# The Qt executables (moc, uic, rcc, ...), as well as the compiler and
+# linker, get replaced by a small stub that only writes its output
+# file. So the numbers measure SCons and the qt5 tool, not Qt.
+#
+# Each benchmark run builds the project twice, a full build and a
+# no-op rebuild, and writes a JSON report with the wall clock times,
+# the SConscript read times (from "--debug=time") and the time spent
+# in the emitters of the Program call, i.e. mostly Automoc.
+#
+#
+#
+# Usage:
+#
+#   python qtproject.py [options]
+#
+# Options are:
+#
+#   -files N             Number of header/source pairs (default: 2000).
+#   -qobject F           Fraction of the headers that contain
+#                        the Q_OBJECT macro (default: 0.3).
+#   -ui N                Number of .ui forms (default: 50).
+#   -qrc N               Number of .qrc files (default: 10).
+#   -dir N               Number of sources per directory (default: 200).
+#   -strategy N          The QT5_AUTOSCAN_STRATEGY (default: 0).
+#   -jobs N              Number of parallel jobs (default: 1).
+#   -workdir PATH        Where to create the project (default: a
+#                        temporary folder, removed at the end).
+#   -report FILE         Name of the JSON report (default: stdout).
+#   -scons CMD           How to call SCons (default: "python -m SCons").
+#
+# The qt5 tool gets copied from ../../__init__.py into the site_scons
+# folder of the project.
+#
+
+import os, sys, re, json, time, random, shutil, hashlib
+import platform, shlex, subprocess, tempfile
+
+tool_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '..', '..', '__init__.py')
+
+# the executables that get replaced by the stub
+stub_tools = ['moc', 'uic', 'rcc', 'lupdate', 'lrelease', 'cxx']
+
+stub_script = """\
+import os, sys
+args = sys.argv[1:]
+if os.path.basename(sys.argv[0]).startswith('moc') and args == ['-v']:
+    print('moc 5.15.2')
+    sys.exit(0)
+for flag in ('-o', '--dep-file-path'):
+    if flag in args[:-1]:
+        out = args[args.index(flag) + 1]
+        with open(out, 'w') as f:
+            if flag == '-o':
+                f.write('// generated\\n')
+            else:
+                f.write('%s: %s\\n' % (os.path.abspath(args[args.index('-o') + 1]),
+                                       os.path.abspath(args[-1])))
+"""
+
+sconstruct = """\
+DefaultEnvironment(tools=[])
+env = Environment(tools=['default', 'qt5'],
+                  QT5DIR=%(qtdir)r,
+                  CC=%(cxx)r, CXX=%(cxx)r, LINK=%(cxx)r,
+                  QT5_AUTOSCAN_STRATEGY=%(strategy)d)
+
+Export('env')
+SConscript('SConscript')
+"""
+
+sconscript = """\
+import time
+
+Import('env')
+
+sources = []
+for d in %(dirs)r:
+    sources.extend(Glob(d + '/*.cpp'))
+
+start = time.time()
+for ui in Glob('forms/*.ui', strings=True):
+    env.Uic5(ui)
+for i in range(%(qrc)d):
+    sources.extend(env.Qrc5('resources/res%%d' %% i))
+env.Program('bench', sources)
+print('benchmark: emitter %%.6f' %% (time.time() - start))
+"""
+
+ui_form = """\
+<?xml version="1.0" encoding="UTF-8"?>
+<ui version="4.0">
+ <class>Form%(idx)d</class>
+ <widget class="QWidget" name="Form%(idx)d">
+  <widget class="QPushButton" name="button">
+   <property name="text">
+    <string>Button %(idx)d</string>
+   </property>
+  </widget>
+ </widget>
+</ui>
+"""
+
+def write(path, contents):
+    d = os.path.dirname(path)
+    if d and not os.path.isdir(d):
+        os.makedirs(d)
+    with open(path, 'w') as f:
+        f.write(contents)
+
+def writeStubs(bindir):
+    """ Create the stub executables in bindir and return the
+        path of the compiler stub.
+    """
+    stub = os.path.join(bindir, 'stub.py')
+    write(stub, '#!%s\n' % sys.executable + stub_script)
+    for t in stub_tools:
+        exe = os.path.join(bindir, t)
+        if sys.platform == 'win32':
+            write(exe + '.bat', '@"%s" "%s" %%*\n' % (sys.executable, stub))
+        else:
+            shutil.copy(stub, exe)
+            os.chmod(exe, 0o755)
+    if sys.platform == 'win32':
+        return os.path.join(bindir, 'cxx.bat')
+    return os.path.join(bindir, 'cxx')
+
+def writeProject(workdir, options):
+    """ Synthesize the sources of the benchmark project in workdir
+        and return a dictionary with some statistics.
+    """
+    rnd = random.Random(42)
+    stats = {'qobject' : 0, 'moc_included' : 0}
+    dirs = []
+    for i in range(options['files']):
+        d = 'src%d' % (i // options['dir'])
+        if not dirs or dirs[-1] != d:
+            dirs.append(d)
+        name = 'class%d' % i
+        h = ['#ifndef CLASS%d_H' % i,
+             '#define CLASS%d_H' % i,
+             '#include <QObject>',
+             '',
+             '/* Class%d does "something" */' % i,
+             'class Class%d : public QObject' % i,
+             '{']
+        qobject = rnd.random() < options['qobject']
+        if qobject:
+            h.append('    Q_OBJECT')
+            stats['qobject'] += 1
+        h.extend(['public:',
+                  '    int value() const; // returns the value',
+                  '};',
+                  '#endif',
+                  ''])
+        write(os.path.join(workdir, d, name + '.h'), '\n'.join(h))
+
+        cpp = ['#include "%s.h"' % name]
+        if options['ui'] and i % max(1, options['files'] // options['ui']) == 0:
+            ui = (i // max(1, options['files'] // options['ui'])) % options['ui']
+            cpp.append('#include "../forms/ui_form%d.h"' % ui)
+        cpp.extend(['',
+                    'int Class%d::value() const' % i,
+                    '{',
+                    '    return %d;' % i,
+                    '}',
+                    ''])
+        if qobject and i % 2:
+            # half of the moc outputs get included by the cxx file
+            cpp.append('#include "moc_%s.cpp"' % name)
+            stats['moc_included'] += 1
+        write(os.path.join(workdir, d, name + '.cpp'), '\n'.join(cpp))
+
+    for i in range(options['ui']):
+        write(os.path.join(workdir, 'forms', 'form%d.ui' % i), ui_form % {'idx' : i})
+
+    for i in range(options['qrc']):
+        files = []
+        for j in range(10):
+            fname = 'res%d_%d.txt' % (i, j)
+            write(os.path.join(workdir, 'resources', 'data', fname), 'resource %d %d\n' % (i, j))
+            files.append('  <file>data/%s</file>' % fname)
+        write(os.path.join(workdir, 'resources', 'res%d.qrc' % i),
+              '<!DOCTYPE RCC><RCC version="1.0">\n<qresource>\n%s\n</qresource>\n</RCC>\n' %
+              '\n'.join(files))
+
+    qtdir = os.path.join(workdir, 'qt')
+    cxx = writeStubs(os.path.join(qtdir, 'bin'))
+    write(os.path.join(workdir, 'SConstruct'),
+          sconstruct % {'qtdir' : qtdir,
+                        'cxx' : cxx,
+                        'strategy' : options['strategy']})
+    write(os.path.join(workdir, 'SConscript'), sconscript % {'dirs' : dirs, 'qrc' : options['qrc']})
+    tooldir = os.path.join(workdir, 'site_scons', 'site_tools', 'qt5')
+    if not os.path.isdir(tooldir):
+        os.makedirs(tooldir)
+    shutil.copy(tool_path, os.path.join(tooldir, '__init__.py'))
+
+    stats['dirs'] = len(dirs)
+    return stats
+
+debug_time_re = {'read' : re.compile(r'Total SConscript file execution time: ([\d.]+) seconds'),
+                 'total' : re.compile(r'Total SCons execution time: ([\d.]+) seconds'),
+                 'commands' : re.compile(r'Total command execution time: ([\d.]+) seconds'),
+                 'emitter' : re.compile(r'benchmark: emitter ([\d.]+)')}
+
+def runSCons(workdir, options):
+    """ Run SCons once in workdir and return the measured times. """
+    cmd = shlex.split(options['scons']) + ['-Q', '--debug=time', '-j', str(options['jobs'])]
+    start = time.time()
+    p = subprocess.Popen(cmd, cwd=workdir,
+                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                         universal_newlines=True)
+    out = p.communicate()[0]
+    wall = time.time() - start
+    if p.returncode:
+        print(out)
+        raise RuntimeError("SCons failed with exit code %d" % p.returncode)
+    result = {'wall' : round(wall, 3),
+              'up_to_date' : 'is up to date' in out}
+    for key, rex in debug_time_re.items():
+        m = rex.search(out)
+        if m:
+            result[key] = round(float(m.group(1)), 3)
+    return result
+
+def toolHash():
+    with open(tool_path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def sconsVersion(options):
+    try:
+        out = subprocess.check_output(shlex.split(options['scons']) + ['--version'],
+                                      universal_newlines=True)
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+    m = re.search(r'SCons: v(\d+(?:\.\d+)*)', out)
+    if m:
+        return m.group(1)
+    return ''
+
+def main(argv):
+    options = {'files' : 2000,
+               'qobject' : 0.3,
+               'ui' : 50,
+               'qrc' : 10,
+               'dir' : 200,
+               'strategy' : 0,
+               'jobs' : 1,
+               'workdir' : '',
+               'report' : '',
+               'scons' : '"%s" -m SCons' % sys.executable}
+    args = list(argv)
+    while args:
+        a = args.pop(0)
+        key = a.lstrip('-')
+        if not a.startswith('-') or key not in options or not args:
+            print("Usage: python qtproject.py [-files N] [-qobject F] [-ui N] [-qrc N] [-dir N]\n"
+                  "                           [-strategy N] [-jobs N] [-workdir PATH]\n"
+                  "                           [-report FILE] [-scons CMD]")
+            return 1
+        value = args.pop(0)
+        if isinstance(options[key], float):
+            value = float(value)
+        elif isinstance(options[key], int):
+            value = int(value)
+        options[key] = value
+
+    workdir = options['workdir']
+    cleanup = not workdir
+    if cleanup:
+        workdir = tempfile.mkdtemp(prefix='qtproject')
+    elif os.path.exists(workdir):
+        print("Error: %s exists already" % workdir)
+        return 1
+
+    try:
+        start = time.time()
+        stats = writeProject(workdir, options)
+        generate = time.time() - start
+
+        build = runSCons(workdir, options)
+        noop = runSCons(workdir, options)
+    finally:
+        if cleanup:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {'options' : dict((k, v) for k, v in options.items()
+                               if k not in ('workdir', 'report', 'scons')),
+              'project' : stats,
+              'generate' : round(generate, 3),
+              'build' : build,
+              'noop' : noop,
+              'tool_sha1' : toolHash(),
+              'scons' : sconsVersion(options),
+              'python' : platform.python_version(),
+              'platform' : sys.platform,
+              'date' : time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+    contents = json.dumps(report, indent=2, sort_keys=True)
+    if options['report']:
+        with open(options['report'], 'w') as f:
+            f.write(contents + '\n')
+    else:
+        print(contents)
+    if not noop['up_to_date']:
+        print("Warning: the second run was not a no-op")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,12 @@
+#include "mocFromH.h"
+
+#include <QtWidgets/QApplication>
+#include <stdio.h>
+
+int main(int argc, char **argv)
+{
+  QApplication app(argc, argv);
+  mocFromH();
+  printf("Hello World\n");
+  return 0;
+}
@@ -0,0 +1,9 @@
+#include "mocFromH.h"
+
+MyClass2::MyClass2(){}
+
+void MyClass2::myslot() {}
+
+void mocFromH() {
+  MyClass2 myclass;
+}
@@ -0,0 +1,6 @@
+#include "aaa.h"
+
+void dummy_a()
+{
+  aaa a;
+}
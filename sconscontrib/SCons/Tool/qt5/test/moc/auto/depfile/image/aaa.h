@@ -0,0 +1,7 @@
+#include <QObject>
+
+class aaa
+{
+public:
+  aaa() {};
+};
@@ -0,0 +1,14 @@
+#include <QObject>
+#include "version.h"
+
+class MyClass2 : public QObject
+{
+  Q_OBJECT
+
+public:
+  MyClass2();
+public slots:
+  void myslot();
+};
+
+void mocFromH();
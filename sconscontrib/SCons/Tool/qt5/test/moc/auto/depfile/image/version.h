@@ -0,0 +1 @@
+#define MY_VERSION 1
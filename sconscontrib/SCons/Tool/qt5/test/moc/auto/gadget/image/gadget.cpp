@@ -0,0 +1 @@
+#include "gadget.h"
@@ -0,0 +1,12 @@
+#include <QObject>
+
+class Gadget
+{
+  Q_GADGET
+
+public:
+  enum Color { Red, Green, Blue };
+  Q_ENUM(Color)
+
+  Gadget() {};
+};
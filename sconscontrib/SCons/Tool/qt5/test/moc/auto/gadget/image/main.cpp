@@ -0,0 +1,10 @@
+#include "gadget.h"
+#include "space.h"
+#include "plain.h"
+
+int main(int argc, char **argv)
+{
+  Gadget g;
+  Plain p;
+  return 0;
+}
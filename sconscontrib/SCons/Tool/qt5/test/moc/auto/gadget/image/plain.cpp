@@ -0,0 +1 @@
+#include "plain.h"
@@ -0,0 +1,10 @@
+// A class without any meta-object macro
+class Plain
+{
+public:
+  Plain() : MY_Q_GADGET(0), Q_OBJECTS(0) {};
+  const char *name() const { return "Q_GADGET"; };
+
+  int MY_Q_GADGET;
+  int Q_OBJECTS;
+};
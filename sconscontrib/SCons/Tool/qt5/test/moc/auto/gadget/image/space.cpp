@@ -0,0 +1 @@
+#include "space.h"
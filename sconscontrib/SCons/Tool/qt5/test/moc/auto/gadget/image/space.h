@@ -0,0 +1,9 @@
+#include <QObject>
+
+namespace Space
+{
+  Q_NAMESPACE
+
+  enum Mode { On, Off };
+  Q_ENUM_NS(Mode)
+}
@@ -0,0 +1,5 @@
+#include "aaa.h"
+
+Aaa::Aaa()
+{
+}
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2001-2010,2011,2012 The SCons Foundation
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+"""
+Check that QT5_MOC_PCH compiles the moc'ed files of a program with a
+precompiled header of the Qt includes, also in the QT5_AUTOMOC_UNITY
+mode.
+"""
+
+import glob
+import os
+
+import TestSCons
+
+test = TestSCons.TestSCons()
+test.dir_fixture('image')
+test.file_fixture('../../../qtenv.py')
+test.file_fixture('../../../../__init__.py','site_scons/site_tools/qt5/__init__.py')
+
+test.run()
+
+pch = glob.glob(test.workpath('qt5_pch_*.h'))
+test.fail_test(len(pch) != 1)
+pch = os.path.basename(pch[0])
+test.must_contain(pch, '#include <QtCore/QObject>')
+test.must_exist(test.workpath(pch + '.gch'))
+test.fail_test('-include ' + pch not in test.stdout())
+# only the moc'ed file gets the precompiled header
+test.fail_test(test.stdout().count('-include ' + pch) != 1)
+
+test.up_to_date(arguments = '.')
+
+test.run(arguments = 'unity=1')
+test.fail_test('-include ' + pch not in test.stdout())
+test.fail_test('main_mocs_compilation_0' not in test.stdout())
+
+test.pass_test()
+
+# Local Variables:
+# tab-width:4
+# indent-tabs-mode:nil
+# End:
+# vim: set expandtab tabstop=4 shiftwidth=4:
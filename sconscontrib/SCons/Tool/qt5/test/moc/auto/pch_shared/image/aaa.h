@@ -0,0 +1,9 @@
+#include <QObject>
+
+class Aaa : public QObject
+{
+  Q_OBJECT
+
+public:
+  Aaa();
+};
@@ -0,0 +1,7 @@
+#include "aaa.h"
+
+int main()
+{
+  Aaa a;
+  return 0;
+}
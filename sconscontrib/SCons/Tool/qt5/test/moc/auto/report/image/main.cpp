@@ -0,0 +1,9 @@
+#include "widgets/aaa.h"
+#include "widgets/bbb.h"
+
+int main()
+{
+  Aaa a;
+  Bbb b;
+  return b.value();
+}
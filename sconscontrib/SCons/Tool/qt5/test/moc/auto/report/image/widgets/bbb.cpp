@@ -0,0 +1,6 @@
+#include "bbb.h"
+
+int Bbb::value() const
+{
+  return 0;
+}
@@ -0,0 +1,5 @@
+class Bbb
+{
+public:
+  int value() const;
+};
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2001-2010,2011,2012 The SCons Foundation
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+"""
+Check that QT5_AUTOMOC_REPORT writes the Automoc counters per cxx
+file, and sums them up per directory, as JSON or CSV.
+"""
+
+import csv
+import json
+
+import TestSCons
+
+test = TestSCons.TestSCons()
+test.dir_fixture('image')
+test.file_fixture('../../../qtenv.py')
+test.file_fixture('../../../../__init__.py','site_scons/site_tools/qt5/__init__.py')
+
+test.run()
+
+with open(test.workpath('automoc.json')) as f:
+    report = json.load(f)
+sources = dict((r['source'], r) for r in report['sources'])
+test.fail_test(sorted(sources) != ['main.cpp',
+                                   'widgets/aaa.cpp',
+                                   'widgets/bbb.cpp'])
+test.fail_test(sources['widgets/aaa.cpp']['mocs'] != 1)
+test.fail_test(sources['widgets/aaa.cpp']['scanned'] != 2)
+test.fail_test(sources['widgets/bbb.cpp']['mocs'] != 0)
+test.fail_test(sources['main.cpp']['scanned'] != 1)
+test.fail_test(sources['main.cpp']['probes'] < 1)
+test.fail_test(sources['widgets/aaa.cpp']['bytes'] <= 0)
+
+dirs = dict((d['dir'], d) for d in report['directories'])
+test.fail_test(sorted(dirs) != ['.', 'widgets'])
+test.fail_test(dirs['widgets']['sources'] != 2)
+test.fail_test(dirs['widgets']['mocs'] != 1)
+
+test.run(arguments = 'report=automoc.csv')
+
+with open(test.workpath('automoc.csv')) as f:
+    rows = list(csv.DictReader(f))
+test.fail_test(len(rows) != 3)
+test.fail_test(set(r['target'] for r in rows) != set(['main' + TestSCons._exe]))
+
+test.pass_test()
+
+# Local Variables:
+# tab-width:4
+# indent-tabs-mode:nil
+# End:
+# vim: set expandtab tabstop=4 shiftwidth=4:
@@ -0,0 +1,15 @@
+#include "widget1.h"
+#include "widget2.h"
+#include "widget3.h"
+#include "widget4.h"
+#include "widget5.h"
+
+int main(int argc, char **argv)
+{
+  Widget1 w1;
+  Widget2 w2;
+  Widget3 w3;
+  Widget4 w4;
+  Widget5 w5;
+  return 0;
+}
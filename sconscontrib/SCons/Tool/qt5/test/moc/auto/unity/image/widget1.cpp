@@ -0,0 +1 @@
+#include "widget1.h"
@@ -0,0 +1,17 @@
+#ifndef WIDGET1_H
+#define WIDGET1_H
+
+#include <QObject>
+
+class Widget1 : public QObject
+{
+  Q_OBJECT
+
+public:
+  Widget1() {};
+
+signals:
+  void changed();
+};
+
+#endif
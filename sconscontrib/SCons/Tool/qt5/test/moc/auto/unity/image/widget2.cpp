@@ -0,0 +1 @@
+#include "widget2.h"
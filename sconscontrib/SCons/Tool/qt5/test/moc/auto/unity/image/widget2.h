@@ -0,0 +1,17 @@
+#ifndef WIDGET2_H
+#define WIDGET2_H
+
+#include <QObject>
+
+class Widget2 : public QObject
+{
+  Q_OBJECT
+
+public:
+  Widget2() {};
+
+signals:
+  void changed();
+};
+
+#endif
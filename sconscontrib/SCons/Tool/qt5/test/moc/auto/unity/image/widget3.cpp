@@ -0,0 +1 @@
+#include "widget3.h"
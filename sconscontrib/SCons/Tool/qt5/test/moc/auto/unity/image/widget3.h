@@ -0,0 +1,17 @@
+#ifndef WIDGET3_H
+#define WIDGET3_H
+
+#include <QObject>
+
+class Widget3 : public QObject
+{
+  Q_OBJECT
+
+public:
+  Widget3() {};
+
+signals:
+  void changed();
+};
+
+#endif
@@ -0,0 +1 @@
+#include "widget4.h"
@@ -0,0 +1,17 @@
+#ifndef WIDGET4_H
+#define WIDGET4_H
+
+#include <QObject>
+
+class Widget4 : public QObject
+{
+  Q_OBJECT
+
+public:
+  Widget4() {};
+
+signals:
+  void changed();
+};
+
+#endif
@@ -0,0 +1 @@
+#include "widget5.h"
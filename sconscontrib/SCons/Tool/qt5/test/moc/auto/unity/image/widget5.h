@@ -0,0 +1,17 @@
+#ifndef WIDGET5_H
+#define WIDGET5_H
+
+#include <QObject>
+
+class Widget5 : public QObject
+{
+  Q_OBJECT
+
+public:
+  Widget5() {};
+
+signals:
+  void changed();
+};
+
+#endif
@@ -0,0 +1,11 @@
+#include <QtWidgets/QApplication>
+#include <QtCore>
+
+int main(int argc, char *argv[])
+{
+    QApplication app(argc, argv);
+
+    Q_INIT_RESOURCE(icons);
+
+    return 0;
+}
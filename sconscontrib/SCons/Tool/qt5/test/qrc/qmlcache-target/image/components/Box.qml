@@ -0,0 +1,5 @@
+import QtQml 2.0
+
+QtObject {
+    property int size: 42
+}
@@ -0,0 +1,6 @@
+import QtQml 2.0
+import "components"
+import "plugins"
+
+Box {
+}
@@ -0,0 +1,15 @@
+#include <QtCore/QCoreApplication>
+#include <QtQml/QQmlEngine>
+#include <QtQml/QQmlComponent>
+
+int main(int argc, char *argv[])
+{
+    QCoreApplication app(argc, argv);
+
+    Q_INIT_RESOURCE(qml);
+
+    QQmlEngine engine;
+    QQmlComponent component(&engine, QUrl("qrc:/main.qml"));
+
+    return 0;
+}
@@ -0,0 +1,5 @@
+import QtQml 2.0
+import "components"
+
+Box {
+}
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2001-2010,2011,2012 The SCons Foundation
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+
+"""
+Scanning a .qrc file has to scale linearly with the number of its
+resources: list 20000 files (and a folder that gets expanded
+recursively) and scan them within a fixed time budget.
+"""
+
+import re
+
+import TestSCons
+
+test = TestSCons.TestSCons()
+test.dir_fixture('image')
+test.file_fixture('../../qtenv.py')
+test.file_fixture('../../../__init__.py','site_scons/site_tools/qt5/__init__.py')
+
+count = 20000
+folder = 100
+budget = 10.0
+
+test.subdir('icons', ['icons', 'folder'])
+files = []
+for i in range(count):
+    test.write(['icons', 'icon%d.png' % i], '')
+    files.append('    <file>icons/icon%d.png</file>\n' % i)
+for i in range(folder):
+    test.write(['icons', 'folder', 'icon%d.png' % i], '')
+files.append('    <file>icons/folder</file>\n')
+test.write('icons.qrc', """\
+<!DOCTYPE RCC><RCC version="1.0">
+<qresource>
+%s</qresource>
+</RCC>
+""" % ''.join(files))
+
+test.run(arguments = 'scan')
+
+m = re.search(r'scanned (\d+) resources in ([\d.]+) seconds', test.stdout())
+test.fail_test(m is None)
+test.fail_test(int(m.group(1)) != count + folder)
+test.fail_test(float(m.group(2)) > budget)
+
+test.pass_test()
+
+# Local Variables:
+# tab-width:4
+# indent-tabs-mode:nil
+# End:
+# vim: set expandtab tabstop=4 shiftwidth=4:
@@ -0,0 +1,7 @@
+#include "MyFile.h"
+
+aaa::aaa() : my_s(tr("SCons rocks!"))
+{
+  ;
+}
+
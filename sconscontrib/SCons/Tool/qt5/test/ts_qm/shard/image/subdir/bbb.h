@@ -0,0 +1,13 @@
+#include <QObject>
+#include <QString>
+
+class bbb : public QObject
+{
+  Q_OBJECT
+
+public:
+  bbb();
+
+private:
+  QString my_s;
+};
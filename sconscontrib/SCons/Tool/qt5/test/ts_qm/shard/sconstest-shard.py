@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2001-2010,2011,2012 The SCons Foundation
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+#
+
+
+"""
+Runs the Ts() builder with QT5_LUPDATE_SHARD='dir', such that
+lupdate gets called per folder and lconvert merges the results.
+"""
+
+import os
+
+import TestSCons
+
+test = TestSCons.TestSCons()
+test.dir_fixture("image")
+test.file_fixture('../../qtenv.py')
+test.file_fixture('../../../__init__.py','site_scons/site_tools/qt5/__init__.py')
+test.run(stderr=None)
+
+test.must_exist(test.workpath('my_en_shard_top.ts'))
+test.must_exist(test.workpath('my_en_shard_subdir.ts'))
+test.must_not_exist(test.workpath('my_de_shard_top.ts'))
+for ts in ['my_en.ts', 'my_de.ts']:
+    test.must_exist(test.workpath(ts))
+    test.must_contain(test.workpath(ts),'SCons rocks!')
+    test.must_contain(test.workpath(ts),'And Qt5 too!')
+test.up_to_date(options = '-n', arguments = '.')
+
+# only the shard of the changed file gets extracted again
+test.write(['subdir', 'bbb.cpp'], test.read(['subdir', 'bbb.cpp'], mode='r') + '\n')
+test.run(stderr=None)
+test.must_contain_all_lines(test.stdout(), [os.path.join('subdir', 'bbb.cpp')])
+test.must_not_contain_any_line(test.stdout(), ['MyFile.cpp'])
+
+test.pass_test()
+
+# Local Variables:
+# tab-width:4
+# indent-tabs-mode:nil
+# End:
+# vim: set expandtab tabstop=4 shiftwidth=4:
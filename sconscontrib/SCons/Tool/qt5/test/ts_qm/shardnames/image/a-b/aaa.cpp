@@ -0,0 +1,6 @@
+#include "aaa.h"
+
+aaa::aaa() : my_s(tr("SCons rocks!"))
+{
+  ;
+}
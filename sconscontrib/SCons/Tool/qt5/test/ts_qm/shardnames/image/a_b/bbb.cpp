@@ -0,0 +1,6 @@
+#include "bbb.h"
+
+bbb::bbb() : my_s(tr("And Qt5 too!"))
+{
+  ;
+}